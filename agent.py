@@ -4,6 +4,11 @@ import uuid
 import numpy as np
 
 from common_data import *
+from eventlog import DEATH, FIRE
+from randomness import DirectRandom
+
+# 没有environment的agent使用独立的随机数流
+_direct_random = DirectRandom(np.random.default_rng())
 
 
 class Status(Enum):
@@ -39,10 +44,29 @@ class AgentType(Enum):
 
 class Agent:
     def __init__(self, **kwargs):
-        self.id = kwargs.get('id', int(uuid.uuid4()))
+        # 外部id (uuid)，只在需要时生成；仿真内部使用稠密的index
+        self._id = kwargs.get('id', None)
         self.x = kwargs.get('x', 0)
         self.y = kwargs.get('y', 0)
         self.wealth = kwargs.get('wealth', 0.0)
+        self.index = kwargs.get('index', None)
+        self.environment = kwargs.get("environment", None)
+
+    @property
+    def id(self):
+        if self._id is None:
+            self._id = int(uuid.uuid4())
+        return self._id
+
+    @property
+    def random(self):
+        if self.environment is not None:
+            return self.environment.random
+        return _direct_random
+
+    def _registries_changed(self, person):
+        if self.environment is not None:
+            self.environment.update_registries(person)
 
 
 class HealthCare(Agent):
@@ -68,12 +92,21 @@ class Person(Agent):
         super(Person, self).__init__(**kwargs)
         self.type = AgentType.Person
         self.age = kwargs.get('age', 0)
+        # 按年龄的每日住院、重症、死亡概率
+        ix = self.age // 10 - 1 if self.age > 10 else 0
+        self.hospitalization_prob = age_hospitalization_probs[ix]
+        self.severe_prob = age_severe_probs[ix]
+        self.death_prob = age_death_probs[ix]
         
-        ## 传染病
-        self.status = kwargs.get('status', Status.Susceptible)
-        self.infected_status = InfectionSeverity.Asymptomatic
-        self.infected_time = kwargs.get('infected_time', 0)
-        self.is_in_quarantine = False
+        ## 传染病 (状态变化时通知environment更新计数)
+        self._status = kwargs.get('status', Status.Susceptible)
+        self._infected_status = kwargs.get('infected_status', InfectionSeverity.Asymptomatic)
+        # 感染天数由感染开始的日期推算，不需要每天更新
+        self._infected_time = kwargs.get('infected_time', 0)
+        self._infected_since = self._clock() - self._infected_time
+        # 接触时的传染概率，由environment的感染事件更新
+        self.contagiousness = 0.0
+        self._is_in_quarantine = False
         # 经济活动
         self.social_stratum = kwargs.get('social_stratum', 0)
         if self.age > 16 and self.age <= 65:
@@ -88,15 +121,66 @@ class Person(Agent):
         
         # 家庭活动
         self.house = None
-        
-        self.environment = kwargs.get("environment", None)
+
+    @property
+    def status(self):
+        return self._status
+
+    @status.setter
+    def status(self, value):
+        old = self._status
+        if old != Status.Infected and value == Status.Infected:
+            self._infected_since = self._clock() - self._infected_time
+        elif old == Status.Infected and value != Status.Infected:
+            self._infected_time = self._clock() - self._infected_since
+        self._status = value
+        if self.environment is not None:
+            self.environment.person_transition(self, old, self._infected_status)
+
+    def _clock(self):
+        return self.environment.day if self.environment is not None else 0
+
+    @property
+    def infected_time(self):
+        if self._status == Status.Infected:
+            return self._clock() - self._infected_since
+        return self._infected_time
+
+    @infected_time.setter
+    def infected_time(self, value):
+        self._infected_time = value
+        self._infected_since = self._clock() - value
+        if self._status == Status.Infected and self.environment is not None:
+            self.environment.schedule_infection(self)
+
+    @property
+    def is_in_quarantine(self):
+        if self.environment is not None and self.index is not None:
+            return bool(self.environment.group('quarantine')[self.index])
+        return self._is_in_quarantine
+
+    @is_in_quarantine.setter
+    def is_in_quarantine(self, value):
+        if self.environment is not None and self.index is not None:
+            self.environment.group('quarantine')[self.index] = value
+        else:
+            self._is_in_quarantine = value
+
+    @property
+    def infected_status(self):
+        return self._infected_status
+
+    @infected_status.setter
+    def infected_status(self, value):
+        old = self._infected_status
+        self._infected_status = value
+        if self.environment is not None:
+            self.environment.person_transition(self, self._status, old)
     
     def move_freely(self, amplitudes):
         if self.infected_status != InfectionSeverity.Asymptomatic:
             return
-        x,y = np.random.normal(0,
-                               amplitudes[self.status],
-                               2)
+        x, y = self.random.normal(amplitudes[self.status])
         self.x = int(self.x + x)
         self.y = int(self.y + y)
         
@@ -105,7 +189,7 @@ class Person(Agent):
             return
         if self.economical_status == 1:
             if self.employer is not None and self.employer.open:
-                x, y = np.random.normal(0.0, 0.25, 2)
+                x, y = self.random.normal(0.25)
                 self.x = int(self.employer.x + x)
                 self.y = int(self.employer.y + y)
                 self.employer.checkin(self)
@@ -117,7 +201,7 @@ class Person(Agent):
             return
         
         if self.house is not None:
-            x, y = np.random.normal(0.0, 0.25, 2)
+            x, y = self.random.normal(0.25)
             self.x = int(self.house.x + x)
             self.y = int(self.house.y + y)
             self.house.checkin(self)
@@ -126,13 +210,13 @@ class Person(Agent):
             self.move_freely(amplitudes)
     
     def move_to_healthcare(self, healthcare:HealthCare):
-        x, y = np.random.normal(0.0, 0.5, 2)
+        x, y = self.random.normal(0.5)
         self.x = int(healthcare.x + x)
         self.y = int(healthcare.y + y)
         healthcare.checkin(self)
     
     def move_to_quarantine(self):
-        x, y = np.random.normal(0.0, 0.5, 2)
+        x, y = self.random.normal(0.5)
         self.x = self.environment.quarantine_x + x
         self.y = self.environment.quarantine_y + y
         self.is_in_quarantine = True
@@ -151,6 +235,9 @@ class Person(Agent):
             self.wealth += value
 
     def after_death(self):
+        events = getattr(self.environment, 'events', None)
+        if events is not None:
+            events.log(self.environment.iteration, DEATH, self.index, -1, self.infected_time)
         if self.infected_status == InfectionSeverity.Hospitalization or \
             (self.infected_status == InfectionSeverity.Severe):
                 self.environment.healthcare.size -= 1
@@ -170,56 +257,14 @@ class Person(Agent):
         else:
             # ? 社会财富减少？
             self.environment.government.wealth -= self.expenses
-        
-    
-    def update(self, env):
-        recovering_time = env.recovering_time
-        healthcare = env.healthcare
-        statistics = env.get_statistics()
-        critical_limit = env.critical_limit
-        
-        if self.status == Status.Death:
-            return
-        
-        if self.status == Status.Infected:
-            self.infected_time += 1
-            ix = self.age // 10 - 1 if self.age > 10 else 0
-            test_sub = np.random.random()
-            if self.infected_status == InfectionSeverity.Asymptomatic:
-                if age_hospitalization_probs[ix] > test_sub:
-                    # 住院
-                    self.infected_status = InfectionSeverity.Hospitalization
-                    self.move_to_healthcare(healthcare)
-            elif self.infected_status == InfectionSeverity.Hospitalization:
-                if age_severe_probs[ix] > test_sub:
-                    # 转为重症
-                    self.infected_status = InfectionSeverity.Severe
-                    # 医院超出承载能力
-                    if statistics[InfectionSeverity.Severe.name]\
-                        + statistics[InfectionSeverity.Hospitalization.name] >= \
-                            critical_limit:
-                                # 死亡
-                                self.after_death()
-
-            death_test = np.random.random()
-            if age_death_probs[ix] > death_test:
-                # ? 死亡之后的操作呢？
-                self.after_death()
-                return
-
-            if self.infected_time > recovering_time:
-                self.infected_time = 0
-                if self.infected_status == InfectionSeverity.Hospitalization:
-                    self.environment.healthcare.size -= 1
-                self.status = Status.Recovered_Immune
-                self.infected_status = InfectionSeverity.Asymptomatic
 
 
 class Business(Agent):
     def __init__(self, **kwargs):
         super(Business, self).__init__(**kwargs)
         self.type = AgentType.Business
-        self.employees = []
+        # 员工 {index: Person}
+        self.employees = {}
         self.num_employees = 0
         self.incomes = 0.0
         self.expenses = 0.0
@@ -242,15 +287,20 @@ class Business(Agent):
     
     def hire(self, person:Person):
         if self.check_person(person):
-            self.employees.append(person)
+            self.employees[person.index] = person
             person.employer = self
+            self._registries_changed(person)
             self.num_employees += 1
             # ? 个人开销和公司开销一致？
             self.fixed_expense += (person.expenses / 720) * 24
     
     def fire(self, person:Person):
-        self.employees.remove(person)
+        events = getattr(self.environment, 'events', None)
+        if events is not None:
+            events.log(self.environment.iteration, FIRE, person.index, self.index, person.incomes)
+        del self.employees[person.index]
         person.employer = None
+        self._registries_changed(person)
         # ? 支付一个月工资？
         self.wealth -= person.incomes
         person.supply(person.incomes)
@@ -265,7 +315,7 @@ class Business(Agent):
     
     def supply(self, agent):
         """Incomes due to selling product/service"""
-        qty = np.random.randint(1, 10)
+        qty = self.random.integer(1, 10)
         if qty > self.stocks:
             qty = self.stocks
         if agent.type == AgentType.Person:
@@ -283,7 +333,7 @@ class Business(Agent):
     def demand(self, person):
         """Expenses due to employee payments"""
         labor = 0
-        if person in self.employees:
+        if person.employer is self:
             #labor = self.labor_expenses[agent.id]
             if person.status != Status.Death and person.infected_status == InfectionSeverity.Asymptomatic:
                 labor = person.incomes
@@ -309,7 +359,7 @@ class Business(Agent):
     def accounting(self, env):
         # monthly
         labor = 0.0
-        for person in self.employees:
+        for person in self.employees.values():
             labor += self.demand(person)
         tax = self.taxes(env)
 
@@ -341,7 +391,7 @@ class Government(Agent):
     def update(self, env):
         # daily
         # 政府向企业购买产品/服务，public spending
-        ix = np.random.randint(0, env.total_business)
+        ix = env.random.integer(0, env.total_business)
         env.business[ix].supply(self)
     
     def accounting(self, env):
@@ -373,8 +423,9 @@ class House(Agent):
         self.wealth += person.wealth
         self.size += 1
         person.house = self
+        self._registries_changed(person)
         # 回到家里来吧
-        x, y = np.random.normal(0.0, 0.25, 2)
+        x, y = person.random.normal(0.25)
         person.x = int(self.x + x)
         person.y = int(self.y + y)
         self.fixed_expenses += (person.expenses / 720) * 24
@@ -394,6 +445,7 @@ class House(Agent):
     
     def remove_mate(self, person):
         self.homemates.remove(person)
+        self._registries_changed(person)
         # 还留有遗产在家
         self.wealth -= person.wealth / 2
         self.size -= 1
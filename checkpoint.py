@@ -0,0 +1,157 @@
+"""
+Checkpoints of a running Simulator
+
+A checkpoint is one uncompressed .npz archive holding the agents as table
+columns (the arrays of the array engine, or the agent objects packed into
+tables), the groups of the interventions, the random generator state and
+the scalar state of the simulator. It is written to a temporary file that
+replaces the previous checkpoint only once complete.
+"""
+
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from agent import Status
+from interventions import Scenario
+from population import ArrayEngine, BusinessTable, HouseTable, Population
+from randomness import RandomBuffer
+from spatial import PointIndex
+
+FORMAT_VERSION = 1
+
+TABLES = [('population', Population), ('houses', HouseTable), ('business', BusinessTable)]
+
+# 缓存而非状态: statistics不保存，resume后需重新计算财富统计
+TRANSIENT = ('_wealth_iteration',)
+
+
+def _scalar(value):
+    """value as a JSON scalar, or None if it is not one"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return None
+
+
+def _scalars(d):
+    """The entries of d that are JSON scalars"""
+    out = {}
+    for k, v in d.items():
+        s = _scalar(v)
+        if s is not None or v is None:
+            out[k] = s
+    return out
+
+
+def save_checkpoint(sim, path):
+    """Write the complete state of sim to path, atomically"""
+    engine = sim.engine
+    arrays = {}
+    if engine is not None:
+        tables = (engine.population, engine.houses, engine.business)
+        arrays['balances'] = engine.balances
+    else:
+        tables = (Population.from_agents(sim.population),
+                  HouseTable.from_agents(sim.houses),
+                  BusinessTable.from_agents(sim.business))
+    for (name, _), table in zip(TABLES, tables):
+        for column, values in table.columns().items():
+            arrays['{}.{}'.format(name, column)] = values
+    for name, mask in sim.groups.items():
+        arrays['groups.' + name] = mask
+    pools = None
+    if isinstance(sim.random, RandomBuffer):
+        arrays['random.normals'] = np.array(sim.random._pool_normals, dtype=np.float64)
+        arrays['random.uniforms'] = np.array(sim.random._pool_uniforms, dtype=np.float64)
+        pools = [sim.random._pool_normals_pos, sim.random._pool_uniforms_pos]
+
+    # 事件记录写到checkpoint为止，resume时截去之后的事件
+    if sim.events is not None:
+        sim.events.flush()
+    seed = sim.seed_sequence
+    meta = {
+        'version': FORMAT_VERSION,
+        # 构造参数中可保存的部分 (回调函数等需要在resume时重新传入)
+        'parameters': _scalars(sim.parameters),
+        'scenario': sim.scenario.to_dict() if sim.scenario is not None else None,
+        'seed': [seed.entropy, list(seed.spawn_key), seed.pool_size],
+        'amplitudes': {s.name: a for s, a in sim.amplitudes.items()},
+        'state': {k: v for k, v in _scalars(vars(sim)).items() if k not in TRANSIENT},
+        'rng_state': sim.rng.bit_generator.state,
+        'random_pools': pools,
+        'government': {'wealth': float(sim.government.wealth)},
+        'healthcare': {'size': int(sim.healthcare.size),
+                       'expenses': float(sim.healthcare.expenses),
+                       'wealth': float(sim.healthcare.wealth)},
+        'total_balance': float(engine.total_balance) if engine is not None else None,
+        'events': len(sim.events) if sim.events is not None else None,
+    }
+    arrays['meta'] = np.array(json.dumps(meta))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.npz')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def load_checkpoint(simulator_class, path, **kwargs):
+    """
+    Rebuild the Simulator saved at path
+    :param kwargs: Simulator parameters that could not be saved (e.g.
+        callbacks or distribution functions), or overrides
+    :return: Simulator, ready to continue with run()
+    """
+    with np.load(path) as data:
+        meta = json.loads(str(data['meta']))
+        if meta['version'] != FORMAT_VERSION:
+            raise ValueError('unsupported checkpoint version: {}'.format(meta['version']))
+        parameters = {}
+        if meta['scenario'] is not None:
+            parameters = Scenario.from_dict(meta['scenario']).simulation_parameters()
+        parameters.update(meta['parameters'])
+        parameters['amplitudes'] = {Status[k]: v for k, v in meta['amplitudes'].items()}
+        entropy, spawn_key, pool_size = meta['seed']
+        parameters['seed'] = np.random.SeedSequence(entropy, spawn_key=spawn_key,
+                                                    pool_size=pool_size)
+        parameters.update(kwargs)
+        sim = simulator_class(**parameters)
+        for k, v in meta['state'].items():
+            # 传入的参数优先于保存的状态
+            if k not in kwargs and k not in TRANSIENT:
+                setattr(sim, k, v)
+        sim.rng.bit_generator.state = meta['rng_state']
+        if meta['random_pools'] is not None and isinstance(sim.random, RandomBuffer):
+            sim.random._pool_normals = data['random.normals'].tolist()
+            sim.random._pool_uniforms = data['random.uniforms'].tolist()
+            sim.random._pool_normals_pos, sim.random._pool_uniforms_pos = meta['random_pools']
+        sim.government.wealth = meta['government']['wealth']
+        for k, v in meta['healthcare'].items():
+            setattr(sim.healthcare, k, v)
+        if sim.events is not None and meta.get('events') is not None:
+            sim.events.truncate(meta['events'])
+        for key in data.files:
+            if key.startswith('groups.'):
+                sim.groups[key[len('groups.'):]] = data[key]
+
+        tables = [cls.from_columns({column: data['{}.{}'.format(name, column)]
+                                    for column in cls.fields})
+                  for name, cls in TABLES]
+        if sim.engine_type == 'array':
+            sim.engine = ArrayEngine(sim, record_transfers=sim.record_transfers)
+            sim.engine.restore(*tables, balances=data['balances'],
+                               total_balance=meta['total_balance'])
+        else:
+            sim.create_agents(*tables)
+    business = tables[2]
+    sim.business_index = PointIndex(business.x, business.y, sim.business_distance)
+    return sim
@@ -0,0 +1,153 @@
+"""
+Monte Carlo ensemble of simulations over intervention scenarios
+
+Every job (scenario, replica, parameter overrides) builds its own
+Simulator in a worker process and returns the daily statistics.
+"""
+
+import argparse
+import os
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from interventions import get_scenario
+from recorder import AsyncRecorder
+from results import ResultWriter
+from simulation import Simulator
+
+Job = namedtuple('Job', ['scenario', 'replica', 'overrides'])
+
+
+def make_jobs(scenarios, replicas, overrides=None):
+    """
+    Every combination of scenario, replica and parameter overrides
+    :param scenarios: list of Scenario or names of built-in scenarios
+    :param replicas: int, number of seeds per scenario
+    :param overrides: list of dicts of Simulator parameters, or policy parameters
+        of built-in scenarios, default [{}]
+    :return: list of Job
+    """
+    if overrides is None:
+        overrides = [{}]
+    return [Job(s, r, o) for s in scenarios for o in overrides for r in range(replicas)]
+
+
+def job_seed(job, base_seed=0):
+    """
+    Seed of a job, only depends on base_seed and the replica number,
+    so every scenario of a replica sees the same random numbers
+    """
+    return np.random.SeedSequence([base_seed, job.replica])
+
+
+def run_job(job, ticks, base_seed=0, population_cache=None, results_dir=None,
+            results_policy='block'):
+    """
+    Run one simulation for `ticks` hours
+    :param population_cache: directory of cached populations (see popcache.py),
+        shared by the scenarios of a replica
+    :param results_dir: if given, the statistics of every tick are streamed to
+        results_dir/<scenario>/<replica> (see results.py)
+    :param results_policy: what to do when the writer thread lags behind,
+        'block', 'drop' or 'downsample' (see recorder.py)
+    :return: dict with the job and the statistics of every day, {name: array}
+    """
+    scenario = job.scenario
+    overrides = dict(job.overrides)
+    if isinstance(scenario, str):
+        # 覆盖参数中的策略参数交给get_scenario，其余为Simulator参数
+        policy_params = {k: overrides.pop(k) for k in list(overrides)
+                         if k in get_scenario(scenario).policy_params}
+        scenario = get_scenario(scenario, **policy_params)
+    simulation_para = scenario.simulation_parameters()
+    simulation_para.update(overrides)
+    simulation_para['seed'] = job_seed(job, base_seed)
+    if population_cache is not None:
+        simulation_para['population_cache'] = population_cache
+    sim = Simulator(**simulation_para)
+    sim.initialize()
+    writer = None
+    if results_dir is not None:
+        writer = AsyncRecorder(ResultWriter(os.path.join(results_dir, scenario_name(job),
+                                                         'replica_{}'.format(job.replica))),
+                               policy=results_policy)
+    days = []
+    for t in range(ticks):
+        sim.run()
+        if writer is not None:
+            writer.append(sim)
+        if sim.iteration % 24 == 0:
+            days.append(sim.get_statistics('all').copy())
+    if writer is not None:
+        writer.close()
+    statistics = {k: np.array([d[k] for d in days]) for k in days[0]} if days else {}
+    return {'job': job, 'statistics': statistics}
+
+
+def scenario_name(job):
+    return job.scenario if isinstance(job.scenario, str) else job.scenario.name
+
+
+def print_progress(done, total, job):
+    print('[{}/{}] {} replica={} {}'.format(done, total, scenario_name(job), job.replica,
+                                            job.overrides or ''))
+    sys.stdout.flush()
+
+
+def run_ensemble(jobs, ticks, base_seed=0, max_workers=None, progress=print_progress,
+                 population_cache=None, results_dir=None, results_policy='block'):
+    """
+    Run jobs over a process pool, using every local core by default
+    :param progress: callable(done, total, job) called as jobs finish, or None
+    :return: list of run_job results, in the order of jobs
+    """
+    results = [None] * len(jobs)
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        futures = {pool.submit(run_job, job, ticks, base_seed, population_cache,
+                               results_dir, results_policy): i for i, job in enumerate(jobs)}
+        for done, f in enumerate(as_completed(futures), 1):
+            i = futures[f]
+            results[i] = f.result()
+            if progress is not None:
+                progress(done, len(jobs), jobs[i])
+    return results
+
+
+def collect(results):
+    """
+    Group results by scenario
+    :return: {scenario: {name: array of shape (runs, days)}}
+    """
+    grouped = {}
+    for r in results:
+        runs = grouped.setdefault(scenario_name(r['job']), {})
+        for k, v in r['statistics'].items():
+            runs.setdefault(k, []).append(v)
+    return {s: {k: np.array(v) for k, v in runs.items()} for s, runs in grouped.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Monte Carlo ensemble of scenarios')
+    parser.add_argument('scenarios', nargs='+')
+    parser.add_argument('--replicas', type=int, default=10)
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--population-cache', default=None)
+    parser.add_argument('--results', default=None)
+    parser.add_argument('--results-policy', default='block',
+                        choices=['block', 'drop', 'downsample'])
+    args = parser.parse_args()
+
+    results = run_ensemble(make_jobs(args.scenarios, args.replicas),
+                           args.days * 24, base_seed=args.seed,
+                           max_workers=args.workers,
+                           population_cache=args.population_cache,
+                           results_dir=args.results,
+                           results_policy=args.results_policy)
+    for scenario, stats in collect(results).items():
+        print(scenario, {k: round(float(stats[k][:, -1].mean()), 3)
+                         for k in ['Infected', 'Death', 'W_Business']})
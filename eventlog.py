@@ -0,0 +1,192 @@
+"""
+Append-only log of the events of a simulation
+
+Infections (Simulator.contact), deaths (Person.after_death) and layoffs
+(Business.fire) are appended as fixed-width records
+
+    tick, type, agent, other, value
+
+to a preallocated batch, flushed to a binary file (or kept in memory)
+when full. EventIndex answers queries by type and tick range with
+binary searches over a per-type index:
+
+    sim = Simulator(event_log='events.bin', ...)
+    ...
+    sim.events.flush()
+    events = load_events('events.bin')
+    events.select(INFECTION, 10 * 24, 20 * 24)
+    events.secondary_cases()
+"""
+
+import os
+
+import numpy as np
+
+EVENT_DTYPE = np.dtype([('tick', np.uint32),
+                        ('type', np.uint8),
+                        ('agent', np.int32),
+                        ('other', np.int32),
+                        ('value', np.float32)])
+
+# 事件类型
+INFECTION = 0  # agent被other传染, value为other的感染天数
+DEATH = 1      # agent死亡, value为感染天数
+FIRE = 2       # agent被公司other解雇, value为支付的工资
+
+EVENT_NAMES = {INFECTION: 'infection', DEATH: 'death', FIRE: 'fire'}
+
+
+class EventLog:
+    """
+    :param path: binary file the records are appended to (after the
+        records it already holds), None to keep them in memory
+    :param capacity: records per batch
+    """
+    def __init__(self, path=None, capacity=65536):
+        self.path = path
+        self.buffer = np.zeros(capacity, dtype=EVENT_DTYPE)
+        self.length = 0
+        self.batches = []
+        self.flushed = 0
+        if path is not None and os.path.exists(path):
+            self.flushed = os.path.getsize(path) // EVENT_DTYPE.itemsize
+        self._index = None
+
+    def __len__(self):
+        return self.flushed + self.length
+
+    def __getstate__(self):
+        # 副本不写入同一文件，已有的记录保存在内存中
+        state = dict(self.__dict__)
+        if self.path is not None:
+            state['batches'] = [self._read_file()]
+            state['path'] = None
+        state['_index'] = None
+        return state
+
+    def log(self, tick, type, agent, other=-1, value=0.0):
+        """Append one event"""
+        if self.length == len(self.buffer):
+            self.flush()
+        self.buffer[self.length] = (tick, type, agent, other, value)
+        self.length += 1
+        self._index = None
+
+    def log_many(self, tick, type, agents, others=-1, values=0.0):
+        """Append events of the same tick and type, arguments broadcast against agents"""
+        agents = np.asarray(agents)
+        n = agents.size
+        if n == 0:
+            return
+        if self.length + n > len(self.buffer):
+            self.flush()
+        if n > len(self.buffer):
+            records = np.zeros(n, dtype=EVENT_DTYPE)
+        else:
+            records = self.buffer[self.length:self.length + n]
+        records['tick'] = tick
+        records['type'] = type
+        records['agent'] = agents
+        records['other'] = others
+        records['value'] = values
+        if n > len(self.buffer):
+            self._write(records)
+        else:
+            self.length += n
+        self._index = None
+
+    def _write(self, records):
+        if self.path is not None:
+            with open(self.path, 'ab') as f:
+                records.tofile(f)
+        else:
+            self.batches.append(records.copy())
+        self.flushed += len(records)
+
+    def flush(self):
+        """Write the pending batch"""
+        if self.length:
+            self._write(self.buffer[:self.length])
+            self.length = 0
+
+    close = flush
+
+    def clear(self):
+        """Remove every event, e.g. when the simulation restarts"""
+        self.truncate(0)
+
+    def truncate(self, count):
+        """Keep the first count events (the events of a checkpoint when resuming)"""
+        self.flush()
+        count = min(count, self.flushed)
+        if self.path is not None:
+            with open(self.path, 'ab') as f:
+                f.truncate(count * EVENT_DTYPE.itemsize)
+        else:
+            self.batches = [np.concatenate(self.batches)[:count]] if self.batches else []
+        self.flushed = count
+        self._index = None
+
+    def _read_file(self):
+        if self.path is None or not os.path.exists(self.path):
+            return np.zeros(0, dtype=EVENT_DTYPE)
+        return np.fromfile(self.path, dtype=EVENT_DTYPE)
+
+    def events(self):
+        """Every event logged, as a structured array"""
+        parts = [self._read_file()] if self.path is not None else list(self.batches)
+        return np.concatenate(parts + [self.buffer[:self.length].copy()])
+
+    def index(self):
+        """EventIndex of the events logged so far"""
+        if self._index is None:
+            self._index = EventIndex(self.events())
+        return self._index
+
+
+class EventIndex:
+    """Queries by type and tick range over an array of events"""
+    def __init__(self, records):
+        self.records = records
+        self._by_type = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def positions(self, type):
+        """Positions of the events of a type, sorted by tick"""
+        if type not in self._by_type:
+            idx = np.flatnonzero(self.records['type'] == type)
+            idx = idx[np.argsort(self.records['tick'][idx], kind='stable')]
+            self._by_type[type] = (idx, np.asarray(self.records['tick'][idx]))
+        return self._by_type[type]
+
+    def _range(self, type, start, stop):
+        idx, ticks = self.positions(type)
+        lo = np.searchsorted(ticks, start, side='left')
+        hi = len(ticks) if stop is None else np.searchsorted(ticks, stop, side='left')
+        return idx[lo:hi]
+
+    def select(self, type, start=0, stop=None):
+        """Events of a type whose tick is in [start, stop)"""
+        return self.records[self._range(type, start, stop)]
+
+    def count(self, type, start=0, stop=None):
+        return len(self._range(type, start, stop))
+
+    def secondary_cases(self, start=0, stop=None, size=None):
+        """
+        Infections caused by every agent, among the infections in [start, stop)
+        :param size: number of agents, by default the largest infector + 1
+        :return: array of counts by agent index
+        """
+        other = self.select(INFECTION, start, stop)['other']
+        other = other[other >= 0]
+        return np.bincount(other, minlength=size or 0)
+
+
+def load_events(path):
+    """EventIndex over the memory-mapped log file of an EventLog"""
+    if os.path.getsize(path) == 0:
+        return EventIndex(np.zeros(0, dtype=EVENT_DTYPE))
+    return EventIndex(np.memmap(path, dtype=EVENT_DTYPE, mode='r'))
@@ -1,4 +1,11 @@
+import dataclasses
+import hashlib
+import inspect
+import json
+from dataclasses import dataclass, field
+
 from agent import Status
+from population import PolicyDecision, INFECTED
 import numpy as np
 
 
@@ -57,9 +64,8 @@ def quarantine_zone(a):
         return False
     
 
-def quarantine_zone_rate(a):
-    rate = 0.6
-    test = np.random.random()
+def quarantine_zone_rate(a, rate=0.6):
+    test = a.random.random()
     if (a.status == Status.Infected) and (test < rate):
         if not a.is_in_quarantine:
             a.move_to_quarantine()
@@ -76,9 +82,8 @@ def home_quarantine(a):
     else:
         return False
 
-def home_quarantine_rate(a):
-    rate = 0.6
-    test = np.random.random()
+def home_quarantine_rate(a, rate=0.6):
+    test = a.random.random()
     if (a.status == Status.Infected) and (test < rate):
         if not a.is_in_quarantine:
             a.move_to_home(a.environment.amplitudes)
@@ -92,8 +97,8 @@ def lockdown(a):
     return True
 
 
-def conditional_lockdown(a):
-    if a.environment.get_statistics()['Infected'] > .05:
+def conditional_lockdown(a, threshold=.05):
+    if a.environment.get_statistics()['Infected'] > threshold:
         return lockdown(a)
     else:
         return False
@@ -107,18 +112,13 @@ def vertical_isolation(a):
     return False
 
 
-isolated = []
-
-
-def sample_isolated(environment, isolation_rate=.5, list_isolated=isolated):
-    for a in environment.population:
-        test = np.random.rand()
-        if test <= isolation_rate:
-            list_isolated.append(a.id)
+def sample_isolated(environment, isolation_rate=.5):
+    test = environment.rng.random(environment.population_size)
+    environment.add_group('isolated', test <= isolation_rate)
 
 
-def check_isolation(list_isolated, agent):
-    if agent.id in list_isolated:
+def check_isolation(agent):
+    if agent.environment.group('isolated')[agent.index]:
         agent.move_to_home(agent.environment.amplitudes)
         return True
     return False
@@ -128,108 +128,238 @@ def no_strict(a):
     return False
 
 
+"""
+Vectorized versions of the interventions, for the array engine: called
+once per tick as on_population_move(sim, pop) with the population arrays
+(see population.Population) and returning a PolicyDecision.
+"""
+
+def population_lockdown(sim, pop):
+    everyone = np.ones(len(pop), dtype=bool)
+    return PolicyDecision(stay_home=everyone, skip=everyone)
+
+
+def population_conditional_lockdown(sim, pop, threshold=.05):
+    if sim.get_statistics()['Infected'] > threshold:
+        return population_lockdown(sim, pop)
+    return None
+
+
+def population_vertical_isolation(sim, pop):
+    isolated = (pop.economical_status == 0) & (pop.house >= 0)
+    return PolicyDecision(stay_home=isolated, skip=isolated)
+
+
+def population_quarantine_zone(sim, pop, rate=1.0):
+    infected = pop.status == INFECTED
+    if rate < 1.0:
+        infected &= sim.rng.random(len(pop)) < rate
+    return PolicyDecision(quarantine=infected & ~pop.is_in_quarantine, skip=infected)
+
+
+def population_lockdown_with_quarantine_zone(sim, pop):
+    infected = pop.status == INFECTED
+    return PolicyDecision(stay_home=~infected,
+                          quarantine=infected & ~pop.is_in_quarantine,
+                          skip=np.ones(len(pop), dtype=bool))
+
+
+def population_home_quarantine(sim, pop, rate=1.0):
+    infected = pop.status == INFECTED
+    if rate < 1.0:
+        infected &= sim.rng.random(len(pop)) < rate
+    return PolicyDecision(go_home=infected & ~pop.is_in_quarantine, skip=infected)
+
+
+def population_check_isolation(sim, pop):
+    isolated = sim.group('isolated')
+    return PolicyDecision(go_home=isolated, skip=isolated)
+
+
+"""
+Policies: compile the callbacks of a Simulator from a name and parameters
+
+Each policy is called with the Simulator and its parameters, and returns
+the callbacks dict. State (e.g. the isolated agents) lives on the
+Simulator, so concurrent simulations do not share it.
+"""
+
+def _person_policy(on_person_move):
+    def compile_policy(sim, **params):
+        return {'on_person_move': lambda x: on_person_move(x, **params)}
+    # 参数与on_person_move相同 (第一个参数为sim)，用于Scenario.compile检查
+    compile_policy.__signature__ = inspect.signature(on_person_move)
+    return compile_policy
+
+
+def _partial_isolation(sim, isolation_rate=.5):
+    return {
+        'post_initialize': lambda x: sample_isolated(x, isolation_rate=isolation_rate),
+        'on_person_move': check_isolation
+    }
+
+
+def _population_policy(on_population_move):
+    def compile_policy(sim, **params):
+        return {'on_population_move': lambda x, pop: on_population_move(x, pop, **params)}
+    # 参数与on_population_move相同，去掉pop
+    signature = inspect.signature(on_population_move)
+    compile_policy.__signature__ = signature.replace(
+        parameters=[p for i, p in enumerate(signature.parameters.values()) if i != 1])
+    return compile_policy
+
+
+def _population_partial_isolation(sim, isolation_rate=.5):
+    return {
+        'post_initialize': lambda x: sample_isolated(x, isolation_rate=isolation_rate),
+        'on_population_move': population_check_isolation
+    }
+
+
+POLICIES = {
+    'no_strict': _person_policy(no_strict),
+    'lockdown': _person_policy(lockdown),
+    'conditional_lockdown': _person_policy(conditional_lockdown),
+    'vertical_isolation': _person_policy(vertical_isolation),
+    'partial_isolation': _partial_isolation,
+    'quarantine_zone': _person_policy(quarantine_zone),
+    'lockdown_with_quarantine_zone': _person_policy(lockdown_with_quarantine_zone),
+    'home_quarantine': _person_policy(home_quarantine),
+    'quarantine_zone_rate': _person_policy(quarantine_zone_rate),
+    'home_quarantine_rate': _person_policy(home_quarantine_rate),
+}
+
+# 同名干预措施的向量化版本
+POPULATION_POLICIES = {
+    'no_strict': lambda sim: {},
+    'lockdown': _population_policy(population_lockdown),
+    'conditional_lockdown': _population_policy(population_conditional_lockdown),
+    'vertical_isolation': _population_policy(population_vertical_isolation),
+    'partial_isolation': _population_partial_isolation,
+    'quarantine_zone': _population_policy(population_quarantine_zone),
+    'lockdown_with_quarantine_zone': _population_policy(population_lockdown_with_quarantine_zone),
+    'home_quarantine': _population_policy(population_home_quarantine),
+    'quarantine_zone_rate': lambda sim, rate=0.6: _population_policy(
+        population_quarantine_zone)(sim, rate=rate),
+    'home_quarantine_rate': lambda sim, rate=0.6: _population_policy(
+        population_home_quarantine)(sim, rate=rate),
+}
+
+
+@dataclass
+class Scenario:
+    """
+    Declarative, picklable description of an intervention scenario
+
+    :param name: scenario name
+    :param policy: key of POLICIES
+    :param policy_params: keyword arguments of the policy, e.g. isolation_rate
+    :param parameters: Simulator parameters overriding global_parameters
+    """
+    name: str
+    policy: str = 'no_strict'
+    policy_params: dict = field(default_factory=dict)
+    parameters: dict = field(default_factory=dict)
+
+    def compile(self, sim):
+        """
+        Callbacks of this scenario for the Simulator sim, vectorized for
+        the array engine (sim.vectorized_policies)
+        """
+        policies = POPULATION_POLICIES if sim.vectorized_policies else POLICIES
+        if self.policy not in policies:
+            raise ValueError('unknown policy: {}'.format(self.policy))
+        policy = policies[self.policy]
+        # 参数错误在编译时报告，而不是在第一个tick
+        try:
+            inspect.signature(policy).bind(sim, **self.policy_params)
+        except TypeError as e:
+            raise TypeError('invalid policy parameters of {}: {}'.format(self.policy, e)) from None
+        return policy(sim, **self.policy_params)
+
+    def simulation_parameters(self):
+        """Keyword arguments of a Simulator running this scenario"""
+        simulation_para = global_parameters.copy()
+        simulation_para.update(self.parameters)
+        simulation_para['scenario'] = self
+        return simulation_para
+
+    def to_dict(self):
+        return dataclasses.asdict(self)
+
+    def key(self):
+        """Stable hash of the scenario, e.g. for caching results"""
+        text = json.dumps(self.to_dict(), sort_keys=True)
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**d)
+
+    @classmethod
+    def from_json(cls, text):
+        return cls.from_dict(json.loads(text))
+
+    @classmethod
+    def from_yaml(cls, text):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError('PyYAML is needed to load YAML scenarios')
+        return cls.from_dict(yaml.safe_load(text))
+
+    @classmethod
+    def load(cls, path):
+        """Load a scenario from a .json, .yaml or .yml file"""
+        with open(path) as f:
+            text = f.read()
+        if path.endswith(('.yaml', '.yml')):
+            return cls.from_yaml(text)
+        return cls.from_json(text)
+
+
+SCENARIOS = {
+    'eco_baseline': Scenario('eco_baseline',
+                             parameters={'initial_infected_perc': 0,
+                                         'initial_immune_perc': 1}),
+    'do_nothing': Scenario('do_nothing'),
+    'lockdown': Scenario('lockdown', policy='lockdown'),
+    'vertical_isolation': Scenario('vertical_isolation', policy='vertical_isolation'),
+    'partial_isolation': Scenario('partial_isolation', policy='partial_isolation',
+                                  policy_params={'isolation_rate': 0.5},
+                                  parameters={'contagion_distance': 1.}),
+    'use_mask': Scenario('use_mask',
+                         parameters={'contagion_distance': 0.2,
+                                     'contagion_rate': 0.3}),
+    'mask_half_isolation': Scenario('mask_half_isolation', policy='partial_isolation',
+                                    policy_params={'isolation_rate': .5},
+                                    parameters={'contagion_distance': 0.05,
+                                                'contagion_rate': 0.1}),
+    'quarantine_zone': Scenario('quarantine_zone', policy='quarantine_zone'),
+    'quarantine_zone_lockdown': Scenario('quarantine_zone_lockdown',
+                                         policy='lockdown_with_quarantine_zone'),
+    'home_quarantine': Scenario('home_quarantine', policy='home_quarantine'),
+    'quarantine_zone_rate': Scenario('quarantine_zone_rate', policy='quarantine_zone_rate',
+                                     policy_params={'rate': 0.6}),
+}
+
+
+def get_scenario(name, **kwargs):
+    """
+    Built-in scenario by name, kwargs override its policy parameters
+    (e.g. isolation_rate of partial_isolation)
+    """
+    if name not in SCENARIOS:
+        raise ValueError('unknown scenario: {}'.format(name))
+    scenario = SCENARIOS[name]
+    unknown = set(kwargs) - set(scenario.policy_params)
+    if unknown:
+        raise TypeError('unknown policy parameters of {}: {}'.format(name, ', '.join(sorted(unknown))))
+    policy_params = dict(scenario.policy_params)
+    policy_params.update(kwargs)
+    return dataclasses.replace(scenario, policy_params=policy_params,
+                               parameters=dict(scenario.parameters))
+
+
 def get_scenario_parameters(name, **kwargs):
-    simulation_para = global_parameters.copy()
-    if name == 'eco_baseline':
-        simulation_para.update(
-            {
-                'initial_infected_perc': 0,
-                'initial_immune_perc': 1,
-                'callbacks': {
-                    'on_person_move': lambda x: no_strict(x)
-                }
-            }
-        )
-    elif name == 'do_nothing':
-        simulation_para.update(
-            {
-                'callbacks': {
-                    'on_person_move': lambda x: no_strict(x)
-                }
-            }
-        )
-    elif name == 'lockdown':
-        simulation_para.update(
-            {
-                'callbacks': {
-                    'on_person_move': lambda x: lockdown(x)
-                }
-            }
-        )
-    elif name == 'vertical_isolation':
-        simulation_para.update(
-            {
-                'callbacks': {
-                    'on_person_move': lambda x: vertical_isolation(x)
-                }
-            }
-        )
-    elif name == 'partial_isolation':
-        rate = kwargs.get('isolation_rate', 0.5)
-        simulation_para.update(
-            {
-                'contagion_distance': 1.,
-                'callbacks': {
-                    'post_initialize': lambda x: sample_isolated(x,
-                                                                 isolation_rate=rate,
-                                                                 list_isolated=isolated),
-                    'on_person_move': lambda x: check_isolation(isolated, x)
-                }
-            }
-        )
-    elif name == 'use_mask':
-        simulation_para.update(
-            {
-                'contagion_distance': 0.2,
-                'contagion_rate': 0.3,
-                'callbacks': {
-                    'on_person_move': lambda x: no_strict(x)
-                }
-            }
-        )
-    elif name == 'mask_half_isolation':
-        simulation_para.update(
-            {
-                'contagion_distance': 0.05,
-                'contagion_rate': 0.1,
-                'callbacks': {
-                    'post_initialize': lambda x: sample_isolated(x,
-                                                                 isolation_rate=.5,
-                                                                 list_isolated=isolated),
-                    'on_person_move': lambda x: check_isolation(isolated, x)
-                }
-            }
-        )
-    elif name == 'quarantine_zone':
-        simulation_para.update(
-            {
-                'callbacks': {
-                    'on_person_move': lambda x: quarantine_zone(x)
-                }
-            }
-        )
-    elif name == 'quarantine_zone_lockdown':
-        simulation_para.update(
-            {
-                'callbacks': {
-                    'on_person_move': lambda x: lockdown_with_quarantine_zone(x)
-                }
-            }
-        )
-    elif name == 'home_quarantine':
-        simulation_para.update(
-            {
-                'callbacks': {
-                    'on_person_move': lambda x: home_quarantine(x)
-                }
-            }
-        )
-    elif name == 'quarantine_zone_rate':
-        simulation_para.update(
-            {
-                'callbacks': {
-                    'on_person_move': lambda x: quarantine_zone_rate(x)
-                }
-            }
-        )
-    return simulation_para
+    return get_scenario(name, **kwargs).simulation_parameters()
@@ -0,0 +1,79 @@
+"""
+Ledger of the wealth transfers of a tick
+"""
+
+import numpy as np
+
+TRANSFER_DTYPE = np.dtype([('source', np.int64),
+                           ('destination', np.int64),
+                           ('amount', np.float64)])
+
+
+class TransferLedger:
+    """
+    Transfers are appended as (source, destination, amount) to
+    preallocated arrays, and applied to an array of account balances
+    with np.add.at once per tick.
+
+    :param capacity: initial number of entries, doubled when full
+    :param record: keep every applied transfer, for auditing (see dump)
+    """
+    def __init__(self, capacity=1024, record=False):
+        self.source = np.zeros(capacity, dtype=np.int64)
+        self.destination = np.zeros(capacity, dtype=np.int64)
+        self.amount = np.zeros(capacity, dtype=np.float64)
+        self.length = 0
+        self.record = record
+        self.records = []
+
+    def __len__(self):
+        return self.length
+
+    def _reserve(self, n):
+        capacity = len(self.amount)
+        if self.length + n <= capacity:
+            return
+        while capacity < self.length + n:
+            capacity *= 2
+        for name in ('source', 'destination', 'amount'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.length] = old[:self.length]
+            setattr(self, name, new)
+
+    def transfer(self, source, destination, amount):
+        """
+        Append transfers, arguments are account indices and amounts,
+        scalars or arrays (broadcast against each other)
+        """
+        source, destination, amount = np.broadcast_arrays(source, destination, amount)
+        n = amount.size
+        if n == 0:
+            return
+        self._reserve(n)
+        end = self.length + n
+        self.source[self.length:end] = source.ravel()
+        self.destination[self.length:end] = destination.ravel()
+        self.amount[self.length:end] = amount.ravel()
+        self.length = end
+
+    def entries(self):
+        """The pending transfers as a structured array (copy)"""
+        out = np.zeros(self.length, dtype=TRANSFER_DTYPE)
+        out['source'] = self.source[:self.length]
+        out['destination'] = self.destination[:self.length]
+        out['amount'] = self.amount[:self.length]
+        return out
+
+    def apply(self, balances):
+        """Settle the pending transfers on balances and clear the ledger"""
+        n = self.length
+        np.subtract.at(balances, self.source[:n], self.amount[:n])
+        np.add.at(balances, self.destination[:n], self.amount[:n])
+        if self.record:
+            self.records.append(self.entries())
+        self.length = 0
+
+    def dump(self):
+        """Every recorded transfer, followed by the pending ones"""
+        return np.concatenate(self.records + [self.entries()])
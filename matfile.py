@@ -0,0 +1,216 @@
+"""
+Lazy access to stored runs
+
+scipy.io.loadmat reads every variable of a .mat file into memory. MatFile
+only reads the tags of a MAT v5 file: it indexes the variables and
+memory-maps their data, so taking one series, or a window of ticks of
+person_position, only reads those pages. Compressed variables (saved with
+do_compression=True) can not be mapped; they are decompressed one at a
+time when accessed, or converted once with convert_to_npy.
+
+    run = open_run('results/sim1/lockdown.mat')
+    run.series('Death')[-1]
+    run.series('person_status', 720, 744)
+
+    compare_runs(glob.glob('results/sim1/*.mat'), ['W_Business', 'Death'])
+"""
+
+import os
+import struct
+import zlib
+from collections.abc import Mapping
+
+import numpy as np
+
+# MAT v5 数据类型
+MI_MATRIX = 14
+MI_COMPRESSED = 15
+MI_TYPES = {
+    1: np.int8, 2: np.uint8, 3: np.int16, 4: np.uint16, 5: np.int32, 6: np.uint32,
+    7: np.float32, 9: np.float64, 12: np.int64, 13: np.uint64,
+}
+# 数值数组类 (mxDOUBLE_CLASS ... mxUINT64_CLASS)
+NUMERIC_CLASSES = range(6, 16)
+COMPLEX_FLAG = 0x0800
+
+HEADER_SIZE = 128
+# 索引时只读取变量的开头 (标志、维度、名称)
+HEAD_SIZE = 4096
+
+
+class StoredRun(Mapping):
+    """
+    Variables of a stored run, {name: array} read lazily
+
+    Arrays are returned with their shape in the file; series drops the
+    leading singleton dimension of MATLAB row vectors so that time is the
+    first axis: statistics are (days,), person_position (ticks, agents, 2).
+    """
+    def series(self, name, start=0, stop=None):
+        """Window [start, stop) of a variable along its time axis"""
+        values = self[name]
+        if values.ndim == 2 and values.shape[0] == 1:
+            values = values[0]
+        return values[start:stop]
+
+    def final(self, names=None):
+        """{name: value at the last tick} of the statistics (1-D series)"""
+        names = names if names is not None else list(self)
+        out = {}
+        for name in names:
+            if name not in self:
+                continue
+            values = self.series(name)
+            if values.ndim == 1:
+                out[name] = values[-1].item()
+        return out
+
+
+class MatFile(StoredRun):
+    """Index of the variables of a MAT v5 file, their data memory-mapped"""
+    def __init__(self, path):
+        self.path = path
+        self.variables = {}
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+            if len(header) < HEADER_SIZE or header[126:128] not in (b'IM', b'MI'):
+                raise ValueError('not a MAT v5 file: {}'.format(path))
+            self.byteorder = '<' if header[126:128] == b'IM' else '>'
+            offset = HEADER_SIZE
+            size = os.fstat(f.fileno()).st_size
+            while offset + 8 <= size:
+                f.seek(offset)
+                mi, nbytes = struct.unpack(self.byteorder + 'II', f.read(8))
+                start = offset + 8
+                if mi == MI_MATRIX:
+                    entry = self._parse_matrix(f.read(min(nbytes, HEAD_SIZE)), start)
+                    if entry is not None:
+                        self.variables[entry[0]] = entry[1:]
+                elif mi == MI_COMPRESSED:
+                    name = self._compressed_name(f.read(min(nbytes, HEAD_SIZE)))
+                    if name is not None:
+                        self.variables[name] = ('compressed', start, nbytes)
+                # 压缩元素没有对齐填充
+                offset = start + nbytes + (-nbytes % 8 if mi != MI_COMPRESSED else 0)
+
+    def _element(self, buffer, pos):
+        """(type, data, next position) of the data element at pos of buffer"""
+        mi, nbytes = struct.unpack_from(self.byteorder + 'II', buffer, pos)
+        if mi >> 16:
+            # 小数据元素: 类型和长度共用4字节
+            return mi & 0xffff, buffer[pos + 4:pos + 4 + (mi >> 16)], pos + 8
+        start = pos + 8
+        return mi, buffer[start:start + nbytes], start + nbytes + (-nbytes % 8)
+
+    def _parse_matrix(self, buffer, base):
+        """
+        (name, dtype, shape, offset of the data in the file) of a numeric
+        array, None for other classes
+        """
+        _, flags, pos = self._element(buffer, 0)
+        flags = struct.unpack_from(self.byteorder + 'I', flags)[0]
+        _, dims, pos = self._element(buffer, pos)
+        shape = tuple(np.frombuffer(dims, dtype=self.byteorder + 'i4').tolist())
+        _, name, pos = self._element(buffer, pos)
+        name = name.decode('ascii')
+        if flags & 0xff not in NUMERIC_CLASSES or flags & COMPLEX_FLAG:
+            return None
+        mi, nbytes = struct.unpack_from(self.byteorder + 'II', buffer, pos)
+        if mi >> 16:
+            mi, offset = mi & 0xffff, pos + 4
+        else:
+            offset = pos + 8
+        if mi not in MI_TYPES:
+            return None
+        return name, np.dtype(MI_TYPES[mi]).newbyteorder(self.byteorder), shape, base + offset
+
+    def _compressed_name(self, buffer):
+        """
+        Name of a compressed variable, from the start of its stream, None
+        if it is not a numeric array
+        """
+        head = zlib.decompressobj().decompress(buffer, HEAD_SIZE)
+        mi, _ = struct.unpack_from(self.byteorder + 'II', head, 0)
+        if mi != MI_MATRIX:
+            return None
+        _, flags, pos = self._element(head, 8)
+        flags = struct.unpack_from(self.byteorder + 'I', flags)[0]
+        if flags & 0xff not in NUMERIC_CLASSES or flags & COMPLEX_FLAG:
+            return None
+        _, _, pos = self._element(head, pos)
+        _, name, _ = self._element(head, pos)
+        return name.decode('ascii')
+
+    def __getitem__(self, name):
+        entry = self.variables[name]
+        if entry[0] == 'compressed':
+            _, start, nbytes = entry
+            with open(self.path, 'rb') as f:
+                f.seek(start)
+                buffer = zlib.decompress(f.read(nbytes))
+            _, nbytes = struct.unpack_from(self.byteorder + 'II', buffer, 0)
+            parsed = self._parse_matrix(buffer[8:8 + nbytes], 8)
+            if parsed is None:
+                raise KeyError(name)
+            _, dtype, shape, offset = parsed
+            count = int(np.prod(shape))
+            return np.frombuffer(buffer, dtype=dtype, count=count,
+                                 offset=offset).reshape(shape, order='F')
+        dtype, shape, offset = entry
+        if 0 in shape:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(self.path, dtype=dtype, mode='r', offset=offset, shape=shape, order='F')
+
+    def __iter__(self):
+        return iter(self.variables)
+
+    def __len__(self):
+        return len(self.variables)
+
+
+class NpyRun(StoredRun):
+    """A run converted by convert_to_npy, one memory-mapped .npy file per variable"""
+    def __init__(self, path):
+        self.path = path
+        self.names = sorted(f[:-len('.npy')] for f in os.listdir(path) if f.endswith('.npy'))
+
+    def __getitem__(self, name):
+        if name not in self.names:
+            raise KeyError(name)
+        return np.load(os.path.join(self.path, name + '.npy'), mmap_mode='r')
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+
+def convert_to_npy(mat_path, path=None):
+    """
+    Write every variable of a .mat file to its own .npy file
+    :return: the directory, mat_path without extension by default
+    """
+    if path is None:
+        path = os.path.splitext(mat_path)[0]
+    os.makedirs(path, exist_ok=True)
+    mat = MatFile(mat_path)
+    for name in mat:
+        np.save(os.path.join(path, name + '.npy'), np.ascontiguousarray(mat[name]))
+    return path
+
+
+def open_run(path):
+    """MatFile of a .mat file, or NpyRun of a directory of convert_to_npy"""
+    if os.path.isdir(path):
+        return NpyRun(path)
+    return MatFile(path)
+
+
+def compare_runs(paths, names):
+    """
+    Final values of some statistics across stored runs
+    :return: {run name: {name: value}}
+    """
+    return {os.path.splitext(os.path.basename(p.rstrip(os.sep)))[0]: open_run(p).final(names)
+            for p in paths}
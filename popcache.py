@@ -0,0 +1,102 @@
+"""
+On-disk cache of the synthetic populations built by build_population
+
+A population is saved as one .npy file per column, in a directory named
+after a hash of the generation parameters and the seed, and reopened with
+memory-mapping: loading is instant and worker processes opening the same
+population share its pages (copy-on-write by default).
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from population import BusinessTable, HouseTable, Population, build_population
+
+# 缓存格式版本，改变生成方法时需要更新
+CACHE_VERSION = 1
+
+# 影响build_population结果的参数
+GENERATION_PARAMETERS = [
+    'population_size', 'total_business', 'width', 'height',
+    'homemates_avg', 'homemates_std', 'homeless_rate', 'unemployment_rate',
+    'initial_infected_perc', 'initial_immune_perc', 'total_wealth',
+    'public_gdp_share', 'business_gdp_share', 'minimum_income', 'minimum_expense',
+]
+
+TABLES = [('population', Population), ('houses', HouseTable), ('business', BusinessTable)]
+
+
+def population_key(sim):
+    """
+    Hash of the generation parameters and the seed of a Simulator, None if
+    its population can not be cached (no seed given)
+    """
+    if sim.seed is None:
+        return None
+    seed = sim.seed_sequence
+    spec = {name: getattr(sim, name) for name in GENERATION_PARAMETERS}
+    spec['seed'] = [str(seed.entropy), list(seed.spawn_key), seed.pool_size]
+    spec['version'] = CACHE_VERSION
+    return hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+
+def save_population(path, sim, tables):
+    """
+    Save the tables of build_population with the state left by it (random
+    generator, government wealth); written to a temporary directory then
+    renamed, so readers never see a partial population
+    """
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent)
+    try:
+        for (name, _), table in zip(TABLES, tables):
+            for column, values in table.columns().items():
+                np.save(os.path.join(tmp, '{}.{}.npy'.format(name, column)), values)
+        meta = {
+            'rng_state': sim.rng.bit_generator.state,
+            'government_wealth': float(sim.government.wealth),
+        }
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        os.rename(tmp, path)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        # 其他进程已写入同一人口
+        if not os.path.isdir(path):
+            raise
+
+
+def load_population(path, sim, mmap_mode='c'):
+    """
+    Reopen a saved population and restore the state of sim as after build_population
+    :param mmap_mode: 'c' copy-on-write, 'r' read-only, None to read into memory
+    :return: (Population, HouseTable, BusinessTable)
+    """
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    tables = []
+    for name, cls in TABLES:
+        columns = {column: np.load(os.path.join(path, '{}.{}.npy'.format(name, column)),
+                                   mmap_mode=mmap_mode)
+                   for column in cls.fields}
+        tables.append(cls.from_columns(columns))
+    sim.rng.bit_generator.state = meta['rng_state']
+    sim.government.wealth = meta['government_wealth']
+    return tuple(tables)
+
+
+def cached_population(sim, cache_dir, mmap_mode='c'):
+    """build_population, through the cache directory cache_dir"""
+    key = population_key(sim)
+    if key is None:
+        return build_population(sim)
+    path = os.path.join(cache_dir, key)
+    if not os.path.isdir(path):
+        save_population(path, sim, build_population(sim))
+    return load_population(path, sim, mmap_mode)
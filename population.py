@@ -0,0 +1,857 @@
+"""
+Structure-of-arrays population engine
+
+The whole population (and the houses and business it uses) is kept in
+contiguous NumPy arrays, and the hourly step of the Simulator runs as
+array operations instead of visiting one Person object at a time.
+"""
+
+import inspect
+from collections import namedtuple
+
+import numpy as np
+
+import eventlog
+from agent import Status, InfectionSeverity
+from common_data import *
+from ledger import TransferLedger
+from spatial import neighbour_pairs
+from util import *
+
+# 状态编码 (uint8)，顺序与枚举定义一致
+STATUS_CODE = {s: i for i, s in enumerate(Status)}
+SEVERITY_CODE = {s: i for i, s in enumerate(InfectionSeverity)}
+
+SUSCEPTIBLE = STATUS_CODE[Status.Susceptible]
+INFECTED = STATUS_CODE[Status.Infected]
+RECOVERED = STATUS_CODE[Status.Recovered_Immune]
+DEATH = STATUS_CODE[Status.Death]
+
+ASYMPTOMATIC = SEVERITY_CODE[InfectionSeverity.Asymptomatic]
+HOSPITALIZATION = SEVERITY_CODE[InfectionSeverity.Hospitalization]
+SEVERE = SEVERITY_CODE[InfectionSeverity.Severe]
+
+
+"""
+Decision of a vectorized policy (the 'on_population_move' callback),
+boolean masks over the population, None meaning nobody:
+    stay_home: check in at home where they are (pay the house expenses)
+    go_home: move back home
+    quarantine: move to the quarantine zone
+    skip: skip the default movement of this tick
+"""
+PolicyDecision = namedtuple('PolicyDecision', ['stay_home', 'go_home', 'quarantine', 'skip'],
+                            defaults=[None, None, None, None])
+
+
+def age_index(age):
+    """Age bucket used by the probability tables of common_data"""
+    return np.where(age > 10, age // 10 - 1, 0)
+
+
+"""
+Outcome of the daily update of the infected agents, boolean masks over them
+"""
+Transitions = namedtuple('Transitions', ['to_hospital', 'to_severe', 'dies', 'recovers'])
+
+
+def daily_transitions(severity, recovering, probs, uniforms, occupied,
+                      population_size, critical_limit):
+    """
+    Daily transitions of the infected agents: hospitalization, severe
+    cases, deaths and recoveries
+
+    The agents are processed as if one at a time in the given order: a new
+    severe case dies when the hospital occupation (hospitalization + severe)
+    seen at its turn reaches critical_limit.
+    :param severity: severity codes of the infected agents
+    :param recovering: mask of the agents whose infection ends today
+    :param probs: (hospitalization, severe, death) daily probabilities of them
+    :param uniforms: (n, 2) U[0, 1) draws, for the severity and the death tests
+    :param occupied: number of living agents in hospitalization or severe
+    :return: Transitions
+    """
+    p_hosp, p_severe, p_death = probs
+    to_hospital = (severity == ASYMPTOMATIC) & (p_hosp > uniforms[:, 0])
+    to_severe = (severity == HOSPITALIZATION) & (p_severe > uniforms[:, 0])
+    dies = p_death > uniforms[:, 1]
+    recovers = ~dies & recovering
+    # 各个agent对医院占用的变化，用于按顺序计算每个新重症看到的占用
+    before = (severity == HOSPITALIZATION) | (severity == SEVERE)
+    after = (before | to_hospital) & ~dies & ~recovers
+    delta = after.astype(np.int64) - before
+    seen = occupied + np.cumsum(delta) - delta
+    adjust = 0
+    for k in np.flatnonzero(to_severe):
+        if (seen[k] + adjust) / population_size >= critical_limit:
+            # 医院超出承载能力，死亡
+            adjust -= 1 + delta[k]
+            dies[k] = True
+            recovers[k] = False
+    return Transitions(to_hospital, to_severe, dies, recovers)
+
+
+def ration(seller, qty, stocks):
+    """
+    Market clearing: every seller serves its orders in turn until it is
+    out of stock, the last one served may only get part of its order
+    :param seller: seller of every order, sorted
+    :param qty: quantity of every order
+    :param stocks: stock of every seller
+    :return: quantity granted to every order
+    """
+    cum = np.cumsum(qty)
+    # 每个seller的累计量从0开始
+    first = np.searchsorted(seller, seller, side='left')
+    cum -= (cum - qty)[first]
+    stock = stocks[seller]
+    return np.minimum(cum, stock) - np.minimum(cum - qty, stock)
+
+
+class ArrayTable:
+    """
+    A set of equally sized columns, declared as {name: (dtype, default)}
+    """
+    fields = {}
+
+    def __init__(self, length):
+        self.length = length
+        for name, (dtype, default) in self.fields.items():
+            setattr(self, name, np.full(length, default, dtype=dtype))
+
+    def __len__(self):
+        return self.length
+
+    def columns(self):
+        return {name: getattr(self, name) for name in self.fields}
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Table over existing arrays (e.g. memory-mapped), without copying"""
+        table = cls.__new__(cls)
+        table.length = len(columns[next(iter(cls.fields))])
+        for name in cls.fields:
+            setattr(table, name, columns[name])
+        return table
+
+
+class Population(ArrayTable):
+    fields = {
+        'x': (np.float64, 0.0),
+        'y': (np.float64, 0.0),
+        'age': (np.int32, 0),
+        'hospitalization_prob': (np.float64, 0.0),
+        'severe_prob': (np.float64, 0.0),
+        'death_prob': (np.float64, 0.0),
+        'status': (np.uint8, SUSCEPTIBLE),
+        'infected_status': (np.uint8, ASYMPTOMATIC),
+        'infected_time': (np.int32, 0),
+        'is_in_quarantine': (np.bool_, False),
+        'social_stratum': (np.uint8, 0),
+        'economical_status': (np.uint8, 0),
+        'incomes': (np.float64, 0.0),
+        'expenses': (np.float64, 0.0),
+        'wealth': (np.float64, 0.0),
+        'employer': (np.int32, -1),
+        'house': (np.int32, -1),
+    }
+
+    @classmethod
+    def from_agents(cls, persons):
+        pop = cls(len(persons))
+        for i, p in enumerate(persons):
+            pop.x[i] = p.x
+            pop.y[i] = p.y
+            pop.age[i] = p.age
+            pop.hospitalization_prob[i] = p.hospitalization_prob
+            pop.severe_prob[i] = p.severe_prob
+            pop.death_prob[i] = p.death_prob
+            pop.status[i] = STATUS_CODE[p.status]
+            pop.infected_status[i] = SEVERITY_CODE[p.infected_status]
+            pop.infected_time[i] = p.infected_time
+            pop.is_in_quarantine[i] = p.is_in_quarantine
+            pop.social_stratum[i] = p.social_stratum
+            pop.economical_status[i] = p.economical_status
+            pop.incomes[i] = p.incomes
+            pop.expenses[i] = p.expenses
+            pop.wealth[i] = p.wealth
+            if p.employer is not None:
+                pop.employer[i] = p.employer.index
+            if p.house is not None:
+                pop.house[i] = p.house.index
+        return pop
+
+
+class HouseTable(ArrayTable):
+    fields = {
+        'x': (np.float64, 0.0),
+        'y': (np.float64, 0.0),
+        'wealth': (np.float64, 0.0),
+        'size': (np.int32, 0),
+        'incomes': (np.float64, 0.0),
+        'expenses': (np.float64, 0.0),
+        'fixed_expenses': (np.float64, 0.0),
+        'social_stratum': (np.uint8, 0),
+    }
+
+    @classmethod
+    def from_agents(cls, houses):
+        table = cls(len(houses))
+        for i, h in enumerate(houses):
+            for name in cls.fields:
+                getattr(table, name)[i] = getattr(h, name)
+        return table
+
+
+class BusinessTable(ArrayTable):
+    fields = {
+        'x': (np.float64, 0.0),
+        'y': (np.float64, 0.0),
+        'wealth': (np.float64, 0.0),
+        'num_employees': (np.int32, 0),
+        'incomes': (np.float64, 0.0),
+        'expenses': (np.float64, 0.0),
+        'fixed_expense': (np.float64, 0.0),
+        # 不含员工部分的固定开支
+        'base_fixed_expense': (np.float64, 0.0),
+        'open': (np.bool_, True),
+        'stocks': (np.int64, 10),
+        'price': (np.float64, 0.0),
+        'sales': (np.int64, 0),
+        'social_stratum': (np.uint8, 0),
+    }
+
+    @classmethod
+    def from_agents(cls, business):
+        table = cls(len(business))
+        for i, b in enumerate(business):
+            for name in cls.fields:
+                if name != 'base_fixed_expense':
+                    getattr(table, name)[i] = getattr(b, name)
+        return table
+
+
+def sample(distribution, n):
+    """
+    n draws of a distribution of the Simulator (e.g. age_distribution),
+    in one call when it takes a size argument, else one call per draw
+    """
+    if len(inspect.signature(distribution).parameters) > 0:
+        return np.asarray(distribution(n))
+    return np.array([distribution() for _ in range(n)])
+
+
+def build_population(sim):
+    """
+    Sample the agents of a Simulator as arrays, with the same
+    distributions as creating them one by one: ages, strata, positions,
+    Lorenz-curve wealth shares, employment and households
+    Sets the wealth of the government.
+    :return: (Population, HouseTable, BusinessTable)
+    """
+    rng = sim.rng
+    n = sim.population_size
+    # 家庭，每个财富级别至少有一个家庭
+    nhouses = int(n / sim.homemates_avg)
+    houses = HouseTable(max(nhouses, 5))
+    houses.x, houses.y = sim.random_positions(len(houses))
+    houses.social_stratum[:] = np.arange(len(houses)) % 5
+    # 公司
+    business = BusinessTable(sim.total_business)
+    business.x, business.y = sim.random_positions(len(business))
+    business.social_stratum[:] = sample(sim.social_stratum, len(business))
+    business.price = (business.social_stratum + 1) * 4.0
+
+    # 人口: 初始感染、初始免疫、易感
+    pop = Population(n)
+    infect_num = int(n * sim.initial_infected_perc)
+    immune_num = int(n * sim.initial_immune_perc)
+    pop.status[:infect_num] = INFECTED
+    pop.infected_time[:infect_num] = 5
+    pop.status[infect_num:infect_num + immune_num] = RECOVERED
+    pop.age[:] = sample(sim.age_distribution, n)
+    pop.social_stratum[:] = sample(sim.social_stratum, n)
+    pop.economical_status[:] = (pop.age > 16) & (pop.age <= 65)
+    ix = age_index(pop.age)
+    pop.hospitalization_prob[:] = np.take(age_hospitalization_probs, ix)
+    pop.severe_prob[:] = np.take(age_severe_probs, ix)
+    pop.death_prob[:] = np.take(age_death_probs, ix)
+
+    # 分配社会总财富
+    sim.government.wealth = sim.total_wealth * sim.public_gdp_share
+    working = pop.economical_status == 1
+    for quintile in range(5):
+        bsel = business.social_stratum == quintile
+        if sim.total_business > 5:
+            btotal = lorenz_curve[quintile] * (sim.total_wealth * sim.business_gdp_share)
+            bqty = max(1.0, np.count_nonzero(bsel))
+        else:
+            btotal = sim.total_wealth * sim.business_gdp_share
+            bqty = sim.total_business
+        business.wealth[bsel] = btotal / bqty
+        psel = working & (pop.social_stratum == quintile)
+        ptotal = lorenz_curve[quintile] * sim.total_wealth * \
+            (1 - (sim.public_gdp_share + sim.business_gdp_share))
+        pop.wealth[psel] = ptotal / max(1.0, np.count_nonzero(psel))
+        pop.incomes[psel] = basic_income[quintile] * sim.minimum_income
+    pop.expenses[:] = np.take(basic_income, pop.social_stratum) * sim.minimum_expense
+
+    # 随机指定为某公司员工
+    hired = np.flatnonzero(working & (rng.random(n) >= sim.unemployment_rate))
+    pop.employer[hired] = rng.integers(0, sim.total_business, len(hired))
+    # 雇用时个人开支尚未设定，公司的固定开支不含员工部分
+    business.num_employees[:] = np.bincount(pop.employer[hired], minlength=len(business))
+
+    # 给他一个家: 最多尝试6次同一财富级别、未满的家庭
+    homeless = (pop.social_stratum == 0) & (rng.random(n) <= sim.homeless_rate)
+    capacity = int(np.ceil(sim.homemates_avg + sim.homemates_std))
+    members = np.argsort(houses.social_stratum, kind='stable')
+    first = np.searchsorted(houses.social_stratum[members], np.arange(5))
+    count = np.bincount(houses.social_stratum, minlength=5)
+    size = np.zeros(len(houses), dtype=np.int64)
+    waiting = np.flatnonzero(~homeless)
+    for attempt in range(6):
+        q = pop.social_stratum[waiting]
+        choice = members[first[q] + (rng.random(len(waiting)) * count[q]).astype(np.int64)]
+        # 同一家庭按人口顺序入住，直到住满
+        order = np.argsort(choice, kind='stable')
+        chosen = choice[order]
+        rank = np.arange(len(chosen)) - np.searchsorted(chosen, chosen, side='left')
+        fits = rank < capacity - size[chosen]
+        pop.house[waiting[order][fits]] = chosen[fits]
+        size += np.bincount(chosen[fits], minlength=len(houses))
+        waiting = waiting[pop.house[waiting] < 0]
+    # 如果人满了 就随便塞吧
+    pop.house[waiting] = rng.integers(0, len(houses), len(waiting))
+
+    housed = np.flatnonzero(pop.house >= 0)
+    hix = pop.house[housed]
+    noise = rng.normal(0.0, 0.25, (len(housed), 2))
+    pop.x[housed] = np.trunc(houses.x[hix] + noise[:, 0])
+    pop.y[housed] = np.trunc(houses.y[hix] + noise[:, 1])
+    houses.size[:] = np.bincount(hix, minlength=len(houses))
+    houses.wealth[:] = np.bincount(hix, weights=pop.wealth[housed], minlength=len(houses))
+    houses.fixed_expenses[:] = np.bincount(hix, weights=(pop.expenses[housed] / 720) * 24,
+                                           minlength=len(houses))
+    return pop, houses, business
+
+
+class ArrayEngine:
+    """
+    Runs the hourly step of a Simulator on a structure-of-arrays population
+
+    Government and HealthCare stay as the Simulator's agent objects, the
+    rest of the agents live in Population, HouseTable and BusinessTable.
+    Interventions are applied with the 'on_population_move' callback,
+    called once per tick with (sim, population) and returning a
+    PolicyDecision (or None).
+
+    Every wealth is an account of `balances`, laid out as
+    [persons | houses | business | government | healthcare | external]
+    (the wealth columns of the tables are views of it). Money only moves
+    through `ledger` and is settled at the end of the tick; money created
+    or destroyed by the model comes from or goes to the external account,
+    so the sum of the balances never changes.
+    """
+    def __init__(self, sim, record_transfers=False):
+        self.sim = sim
+        self.rng = sim.rng
+        self.population = None
+        self.houses = None
+        self.business = None
+        self.balances = None
+        self.ledger = None
+        self.record_transfers = record_transfers
+        self.total_balance = 0.0
+
+    def load(self, population=None, houses=None, business=None):
+        """
+        Take the tables of build_population, or pack the agent objects of
+        the Simulator when not given
+        """
+        sim = self.sim
+        if population is None:
+            population = Population.from_agents(sim.population)
+            houses = HouseTable.from_agents(sim.houses)
+            business = BusinessTable.from_agents(sim.business)
+        self.population = population
+        self.houses = houses
+        self.business = business
+        p = self.population
+        self.business.base_fixed_expense = self.business.fixed_expense - \
+            np.bincount(p.employer[p.employer >= 0],
+                        weights=(p.expenses[p.employer >= 0] / 720) * 24,
+                        minlength=len(self.business))
+        # 隔离状态与Simulator的quarantine分组共用同一数组
+        sim.groups['quarantine'] = self.population.is_in_quarantine
+        self.open_accounts()
+
+    def restore(self, population, houses, business, balances, total_balance):
+        """Take the tables and the accounts saved by a checkpoint"""
+        self.population = population
+        self.houses = houses
+        self.business = business
+        self.sim.groups['quarantine'] = population.is_in_quarantine
+        self.open_accounts()
+        self.balances[:] = balances
+        self.total_balance = total_balance
+
+    def open_accounts(self):
+        """Move the wealth columns into one balances array"""
+        p = self.population
+        self.house_account = len(p)
+        self.business_account = self.house_account + len(self.houses)
+        self.government_account = self.business_account + len(self.business)
+        self.healthcare_account = self.government_account + 1
+        self.external_account = self.government_account + 2
+        self.balances = np.zeros(self.external_account + 1)
+        self.link_accounts(copy=True)
+        self.ledger = TransferLedger(capacity=4 * len(p) + 1024,
+                                     record=self.record_transfers)
+        self.load_public_accounts()
+
+    def link_accounts(self, copy=False):
+        """Make the wealth columns views of balances, copying their values first if copy"""
+        for table, start in ((self.population, 0), (self.houses, self.house_account),
+                             (self.business, self.business_account)):
+            view = self.balances[start:start + len(table)]
+            if copy:
+                view[:] = table.wealth
+            table.wealth = view
+
+    def __setstate__(self, state):
+        # 复制后 (deepcopy/pickle) 的wealth列不再是balances的视图
+        self.__dict__.update(state)
+        if self.balances is not None:
+            self.link_accounts()
+
+    def load_public_accounts(self):
+        """Take the wealth of government and healthcare, and start the conservation check"""
+        self.balances[self.government_account] = self.sim.government.wealth
+        self.balances[self.healthcare_account] = self.sim.healthcare.wealth
+        self.balances[self.external_account] = 0.0
+        self.total_balance = self.balances.sum()
+
+    def settle(self):
+        """Apply the transfers of the tick"""
+        self.ledger.apply(self.balances)
+        self.sim.government.wealth = self.balances[self.government_account]
+        self.sim.healthcare.wealth = self.balances[self.healthcare_account]
+
+    def check_conservation(self, rtol=1e-9):
+        """True if no money appeared or vanished, external account included"""
+        return np.isclose(self.balances.sum(), self.total_balance,
+                          rtol=rtol, atol=rtol * abs(self.sim.total_wealth))
+
+    def _amplitudes(self):
+        amp = np.zeros(len(Status))
+        for s, a in self.sim.amplitudes.items():
+            amp[STATUS_CODE[s]] = a
+        return amp
+
+    # 移动 ------------------------------------------------------------------
+    def move_freely(self, idx):
+        p = self.population
+        if len(idx) == 0:
+            return
+        amp = self._amplitudes()[p.status[idx]]
+        noise = self.rng.normal(0.0, 1.0, (len(idx), 2)) * amp[:, None]
+        p.x[idx] = np.trunc(p.x[idx] + noise[:, 0])
+        p.y[idx] = np.trunc(p.y[idx] + noise[:, 1])
+
+    def move_to_home(self, idx):
+        p = self.population
+        h = self.houses
+        home = idx[p.house[idx] >= 0]
+        hix = p.house[home]
+        noise = self.rng.normal(0.0, 0.25, (len(home), 2))
+        p.x[home] = np.trunc(h.x[hix] + noise[:, 0])
+        p.y[home] = np.trunc(h.y[hix] + noise[:, 1])
+        self.house_checkin(home)
+        # 无家可归
+        homeless = idx[p.house[idx] < 0]
+        self.ledger.transfer(homeless, self.external_account, p.incomes[homeless] / 720)
+        self.move_freely(homeless)
+
+    def house_checkin(self, idx):
+        p = self.population
+        h = self.houses
+        cost = p.expenses[idx] / 720
+        self.ledger.transfer(self.house_account + p.house[idx], self.external_account, cost)
+        h.expenses += np.bincount(p.house[idx], weights=cost, minlength=len(h))
+
+    def move_to_work(self, idx):
+        p = self.population
+        b = self.business
+        idx = idx[p.economical_status[idx] == 1]
+        employed = p.employer[idx] >= 0
+        working = idx[employed]
+        working = working[b.open[p.employer[working]]]
+        bix = p.employer[working]
+        noise = self.rng.normal(0.0, 0.25, (len(working), 2))
+        p.x[working] = np.trunc(b.x[bix] + noise[:, 0])
+        p.y[working] = np.trunc(b.y[bix] + noise[:, 1])
+        # 员工上班
+        b.stocks += np.bincount(bix, minlength=len(b))
+        self.ledger.transfer(self.business_account + bix, self.external_account,
+                             p.expenses[working] / 720)
+        self.move_freely(idx[~employed])
+
+    def move_to_healthcare(self, idx):
+        p = self.population
+        hc = self.sim.healthcare
+        noise = self.rng.normal(0.0, 0.5, (len(idx), 2))
+        p.x[idx] = np.trunc(hc.x + noise[:, 0])
+        p.y[idx] = np.trunc(hc.y + noise[:, 1])
+        hc.size += len(idx)
+        hc.expenses += p.expenses[idx].sum()
+
+    def move_to_quarantine(self, idx):
+        p = self.population
+        noise = self.rng.normal(0.0, 0.5, (len(idx), 2))
+        p.x[idx] = self.sim.quarantine_x + noise[:, 0]
+        p.y[idx] = self.sim.quarantine_y + noise[:, 1]
+        p.is_in_quarantine[idx] = True
+
+    def apply_policy(self, decision, alive):
+        """Apply the side effects of a PolicyDecision, return the skip mask"""
+        p = self.population
+        if decision.quarantine is not None:
+            self.move_to_quarantine(np.flatnonzero(decision.quarantine & alive))
+        if decision.go_home is not None:
+            self.move_to_home(np.flatnonzero(decision.go_home & alive &
+                                             (p.infected_status == ASYMPTOMATIC)))
+        if decision.stay_home is not None:
+            self.house_checkin(np.flatnonzero(decision.stay_home & alive & (p.house >= 0)))
+        return decision.skip
+
+    def move(self):
+        sim = self.sim
+        p = self.population
+        it = sim.iteration
+        alive = p.status != DEATH
+        mobile = alive & (p.infected_status == ASYMPTOMATIC)
+        if 'on_population_move' in sim.callbacks:
+            decision = sim.callbacks['on_population_move'](sim, p)
+            if decision is not None:
+                skip = self.apply_policy(decision, alive)
+                if skip is not None:
+                    mobile &= ~skip
+        idx = np.flatnonzero(mobile)
+        if bed_time(it):
+            self.move_to_home(idx)
+        elif lunch_time(it) or free_time(it) or (not work_day(it)):
+            self.move_freely(idx)
+        elif work_day(it) and work_time(it):
+            self.move_to_work(idx)
+
+    # 消费 ------------------------------------------------------------------
+    def consume(self):
+        """Every person buys from the business nearby, cleared in one batch"""
+        p = self.population
+        h = self.houses
+        b = self.business
+        idx = np.flatnonzero((p.status != DEATH) & (p.infected_status == ASYMPTOMATIC))
+        buyers, bix = self.sim.business_index.query_many(p.x[idx], p.y[idx])
+        buyers = idx[buyers]
+        keep = p.employer[buyers] != bix
+        buyers = buyers[keep]
+        bix = bix[keep]
+        if len(bix) == 0:
+            return
+        # query_many 按公司排序，同一公司内按人口顺序配给
+        qty = ration(bix, self.rng.integers(1, 10, len(buyers)), b.stocks)
+        value = b.price[bix] * p.social_stratum[buyers] * qty
+        self.ledger.transfer(buyers, self.business_account + bix, value)
+        # 家庭也承担同样的开支
+        housed = p.house[buyers] >= 0
+        hix = p.house[buyers][housed]
+        self.ledger.transfer(self.house_account + hix, self.external_account, value[housed])
+        np.add.at(h.expenses, hix, value[housed])
+        b.incomes += np.bincount(bix, weights=value, minlength=len(b))
+        sold = np.bincount(bix, weights=qty, minlength=len(b)).astype(np.int64)
+        b.stocks -= sold
+        b.sales += sold
+
+    # 传染病 ----------------------------------------------------------------
+    def after_death(self, idx):
+        sim = self.sim
+        p = self.population
+        h = self.houses
+        severity = p.infected_status[idx]
+        if sim.events is not None:
+            sim.events.log_many(sim.iteration, eventlog.DEATH, idx, -1, p.infected_time[idx])
+        sim.healthcare.size -= np.count_nonzero((severity == HOSPITALIZATION) |
+                                                (severity == SEVERE))
+        p.status[idx] = DEATH
+        p.infected_status[idx] = ASYMPTOMATIC
+        # 移出家庭
+        housed = idx[p.house[idx] >= 0]
+        self.move_to_home(housed)
+        hix = p.house[housed]
+        self.ledger.transfer(self.house_account + hix, self.external_account,
+                             p.wealth[housed] / 2)
+        np.subtract.at(h.size, hix, 1)
+        np.subtract.at(h.fixed_expenses, hix, (p.expenses[housed] / 720) * 24)
+        self.ledger.transfer(self.government_account, self.external_account,
+                             p.expenses[idx[p.house[idx] < 0]].sum())
+        # 公司解雇
+        self.ledger.transfer(self.government_account, self.external_account,
+                             p.expenses[idx[p.employer[idx] < 0]].sum())
+        employed = idx[p.employer[idx] >= 0]
+        bix = p.employer[employed]
+        if sim.events is not None:
+            sim.events.log_many(sim.iteration, eventlog.FIRE, employed, bix, p.incomes[employed])
+        self.person_supply(employed, p.incomes[employed], self.business_account + bix)
+        p.employer[employed] = -1
+        if len(employed) > 0:
+            self.update_employment()
+
+    def update_employment(self):
+        """Employee counts and fixed expenses of every business, from the employer column"""
+        p = self.population
+        b = self.business
+        employed = p.employer >= 0
+        b.num_employees = np.bincount(p.employer[employed],
+                                      minlength=len(b)).astype(np.int32)
+        b.fixed_expense = b.base_fixed_expense + \
+            np.bincount(p.employer[employed], weights=(p.expenses[employed] / 720) * 24,
+                        minlength=len(b))
+
+    def person_supply(self, idx, value, source):
+        """Income for work paid by the accounts source, to the house when the person has one"""
+        p = self.population
+        h = self.houses
+        source = np.broadcast_to(source, idx.shape)
+        housed = p.house[idx] >= 0
+        hix = p.house[idx][housed]
+        self.ledger.transfer(source[housed], self.house_account + hix, value[housed])
+        np.add.at(h.incomes, hix, value[housed])
+        self.ledger.transfer(source[~housed], idx[~housed], value[~housed])
+
+    def daily_update(self):
+        sim = self.sim
+        p = self.population
+        inf = np.flatnonzero(p.status == INFECTED)
+        p.infected_time[inf] += 1
+        occupied = np.count_nonzero((p.status != DEATH) &
+                                    ((p.infected_status == HOSPITALIZATION) |
+                                     (p.infected_status == SEVERE)))
+        t = daily_transitions(p.infected_status[inf], p.infected_time[inf] > sim.recovering_time,
+                              (p.hospitalization_prob[inf], p.severe_prob[inf], p.death_prob[inf]),
+                              self.rng.random((len(inf), 2)), occupied,
+                              sim.population_size, sim.critical_limit)
+        p.infected_status[inf[t.to_hospital]] = HOSPITALIZATION
+        self.move_to_healthcare(inf[t.to_hospital])
+        p.infected_status[inf[t.to_severe]] = SEVERE
+        self.after_death(inf[t.dies])
+
+        recover = inf[t.recovers]
+        p.infected_time[recover] = 0
+        sim.healthcare.size -= np.count_nonzero(p.infected_status[recover] == HOSPITALIZATION)
+        p.status[recover] = RECOVERED
+        p.infected_status[recover] = ASYMPTOMATIC
+
+    def contagion(self):
+        sim = self.sim
+        p = self.population
+        alive = np.flatnonzero(p.status != DEATH)
+        i, j = neighbour_pairs(p.x[alive], p.y[alive], sim.contagion_distance)
+        i = alive[i]
+        j = alive[j]
+        # 双向接触: agent1 易感, agent2 感染
+        agent1 = np.concatenate([i, j])
+        agent2 = np.concatenate([j, i])
+        sel = (p.status[agent1] == SUSCEPTIBLE) & (p.status[agent2] == INFECTED)
+        agent1 = agent1[sel]
+        agent2 = agent2[sel]
+        low = self.rng.integers(-1, 1, len(agent1))
+        up = self.rng.integers(-1, 1, len(agent1))
+        t = p.infected_time[agent2]
+        contagious = (t >= sim.incubation_time + low) & (t <= sim.contagion_time + up)
+        contagion_test = self.rng.random(len(agent1))
+        success = contagious & (contagion_test <= sim.contagion_rate)
+        infected = agent1[success]
+        if sim.events is not None:
+            # 同一人被多人传染时记录第一个
+            first = np.sort(np.unique(infected, return_index=True)[1])
+            infector = agent2[success][first]
+            sim.events.log_many(sim.iteration, eventlog.INFECTION, infected[first], infector,
+                                p.infected_time[infector])
+        p.status[infected] = INFECTED
+
+    # 经济 ------------------------------------------------------------------
+    def business_update(self):
+        b = self.business
+        bix = np.flatnonzero(b.open)
+        fixed = b.fixed_expense[bix]
+        self.ledger.transfer(self.business_account + bix, self.government_account, fixed / 3)
+        self.ledger.transfer(self.business_account + bix, self.external_account, fixed * 2 / 3)
+
+    def accounting(self):
+        """
+        Monthly accounting of the whole economy in one pass: payroll and
+        taxes of the business, public spending and house taxes
+        """
+        sim = self.sim
+        p = self.population
+        b = self.business
+        h = self.houses
+        gov = sim.government
+        hc = sim.healthcare
+        active = (p.status != DEATH) & (p.infected_status == ASYMPTOMATIC)
+        # 公司: 工资
+        paid = np.flatnonzero(active & (p.employer >= 0))
+        paid = paid[b.open[p.employer[paid]]]
+        self.person_supply(paid, p.incomes[paid], self.business_account + p.employer[paid])
+        # 公司: 税
+        bix = np.flatnonzero(b.open)
+        tax = gov.tax * b.num_employees[bix] + b.incomes[bix] / 20
+        self.ledger.transfer(self.business_account + bix, self.government_account, tax)
+        b.incomes[bix] = 0
+        b.sales[bix] = 0
+        # 政府: 医疗支出，homeless和无工作人员的补贴
+        self.ledger.transfer(self.government_account, self.healthcare_account, hc.expenses)
+        for idx in (np.flatnonzero(active & (p.house < 0)),
+                    np.flatnonzero(active & (p.employer < 0))):
+            self.ledger.transfer(self.government_account, idx, p.expenses[idx])
+        # 家庭: 税
+        taxes = h.incomes / 10 + gov.tax * h.size
+        self.ledger.transfer(self.house_account + np.arange(len(h)),
+                             self.government_account, taxes)
+        h.incomes[:] = 0
+        h.expenses[:] = 0
+
+    def government_update(self):
+        # 政府向企业购买产品/服务，public spending
+        b = self.business
+        bix = self.rng.integers(0, len(b))
+        qty = min(self.rng.integers(1, 10), b.stocks[bix])
+        value = b.price[bix] * 4 * qty
+        self.ledger.transfer(self.government_account, self.business_account + bix, value)
+        b.incomes[bix] += value
+        b.stocks[bix] -= qty
+        b.sales[bix] += qty
+
+    def healthcare_update(self):
+        fixed = self.sim.healthcare.fixed_expenses
+        self.ledger.transfer(self.healthcare_account, self.government_account, fixed / 3)
+        self.ledger.transfer(self.healthcare_account, self.external_account, fixed * 2 / 3)
+
+    def house_update(self):
+        h = self.houses
+        hix = self.house_account + np.arange(len(h))
+        self.ledger.transfer(hix, self.government_account, h.fixed_expenses / 10)
+        self.ledger.transfer(hix, self.external_account, h.fixed_expenses * 9 / 10)
+
+    def step(self, new_d, new_m):
+        sim = self.sim
+        accounting = sim.iteration > 1 and new_m
+        # 个人活动
+        self.move()
+        self.consume()
+        if new_d:
+            self.daily_update()
+        # 公司活动
+        if new_d:
+            self.business_update()
+        if accounting:
+            # 与后面的日常更新互不影响，可以一次完成全部月度结算
+            self.accounting()
+        # 政府活动
+        if new_d:
+            self.government_update()
+        # 医院活动
+        if new_d:
+            self.healthcare_update()
+        # 家庭活动
+        if new_d:
+            self.house_update()
+        self.contagion()
+        # 结算本轮的全部转账
+        self.settle()
+
+    # 重置 ------------------------------------------------------------------
+    def reset(self):
+        """Array version of Simulator.intervention_initialize"""
+        sim = self.sim
+        p = self.population
+        h = self.houses
+        b = self.business
+        people_share = 1 - (sim.public_gdp_share + sim.business_gdp_share)
+        for quintile in range(5):
+            bsel = b.social_stratum == quintile
+            if sim.total_business > 5:
+                btotal = lorenz_curve[quintile] * (sim.total_wealth * sim.business_gdp_share)
+                bqty = max(1.0, np.count_nonzero(bsel))
+            else:
+                btotal = sim.total_wealth * sim.business_gdp_share
+                bqty = sim.total_business
+            b.wealth[bsel] = btotal / bqty
+            psel = p.social_stratum == quintile
+            working = psel & (p.economical_status == 1)
+            ptotal = lorenz_curve[quintile] * sim.total_wealth * people_share
+            p.wealth[working] = ptotal / max(1.0, np.count_nonzero(working))
+            p.incomes[working] = basic_income[quintile] * sim.minimum_income
+            p.expenses[psel] = basic_income[quintile] * sim.minimum_expense
+        b.expenses[:] = 0
+        b.stocks[:] = 10
+        b.sales[:] = 0
+        b.incomes[:] = 0
+
+        # reset house
+        housed = np.flatnonzero(p.house >= 0)
+        hix = p.house[housed]
+        h.size = np.bincount(hix, minlength=len(h)).astype(np.int32)
+        h.wealth[:] = np.bincount(hix, weights=p.wealth[housed], minlength=len(h))
+        h.fixed_expenses = np.bincount(hix, weights=(p.expenses[housed] / 720) * 24,
+                                       minlength=len(h))
+        h.incomes[:] = 0
+        h.expenses[:] = 0
+        p.infected_status[:] = ASYMPTOMATIC
+        self.move_to_home(housed)
+
+        # reset person status
+        infect_num = int(sim.initial_infected_perc * sim.population_size)
+        immune_num = int(sim.initial_immune_perc * sim.population_size)
+        p.status[:] = SUSCEPTIBLE
+        p.infected_time[:] = 0
+        p.status[:infect_num] = INFECTED
+        p.infected_time[:infect_num] = 5
+        p.status[max(infect_num, sim.population_size - immune_num):] = RECOVERED
+        p.is_in_quarantine[:] = False
+        # move_to_home 的开支
+        self.load_public_accounts()
+        self.settle()
+
+    # 统计 ------------------------------------------------------------------
+    def homeless(self):
+        p = self.population
+        return np.flatnonzero((p.house < 0) & (p.status != DEATH) &
+                              (p.infected_status == ASYMPTOMATIC))
+
+    def unemployed(self):
+        p = self.population
+        return np.flatnonzero((p.employer < 0) & (p.status != DEATH) &
+                              (p.infected_status == ASYMPTOMATIC))
+
+    def statistics(self):
+        sim = self.sim
+        p = self.population
+        stats = {}
+        counts = np.bincount(p.status, minlength=len(Status))
+        for s in Status:
+            stats[s.name] = counts[STATUS_CODE[s]] / sim.population_size
+        counts = np.bincount(p.infected_status[p.status != DEATH],
+                             minlength=len(InfectionSeverity))
+        for s in filter(lambda x: x != InfectionSeverity.Exposed, InfectionSeverity):
+            stats[s.name] = counts[SEVERITY_CODE[s]] / sim.population_size
+        adult = (p.age >= 18) & (p.status != DEATH)
+        wealth = np.bincount(p.social_stratum[adult], weights=p.wealth[adult], minlength=5)
+        for q in range(5):
+            stats['Q{}'.format(q + 1)] = wealth[q]
+        stats['W_Business'] = self.business.wealth.sum() / sim.total_wealth
+        stats['W_Person'] = p.wealth.sum() / sim.total_wealth
+        stats['W_Government'] = sim.government.wealth / sim.total_wealth
+        stats['Hospital'] = np.clip(sim.healthcare.size / sim.healthcare.limitation, 0.01, 1)
+        return stats
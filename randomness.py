@@ -0,0 +1,61 @@
+"""
+Random number services used by the agents in the hot paths of a tick
+"""
+
+
+class DirectRandom:
+    """Draws every variate from a Generator with its own call"""
+    def __init__(self, rng):
+        self.rng = rng
+
+    def normal(self, scale):
+        return self.rng.normal(0.0, scale, 2)
+
+    def random(self):
+        return self.rng.random()
+
+    def integer(self, low, high):
+        return self.rng.integers(low, high)
+
+
+class RandomBuffer:
+    """
+    Pool of random variates, refilled by blocks
+
+    The agents draw their variates one at a time, in the per-person loops
+    of a tick, where the overhead of a Generator call and of the numpy
+    scalar it returns outweighs the draw itself. Normals and uniforms are
+    drawn `block` at a time and kept as lists of Python floats, so a draw
+    is a list lookup. The pools are shared by every agent, in the order of
+    the draws, and are saved in checkpoints.
+    """
+    def __init__(self, rng, block=4096):
+        self.rng = rng
+        self.block = block
+        self._pool_normals = []
+        self._pool_normals_pos = 0
+        self._pool_uniforms = []
+        self._pool_uniforms_pos = 0
+
+    def normal(self, scale):
+        """Pair of N(0, scale) variates"""
+        pos = self._pool_normals_pos
+        if pos + 2 > len(self._pool_normals):
+            self._pool_normals = self.rng.standard_normal(self.block).tolist()
+            pos = 0
+        self._pool_normals_pos = pos + 2
+        pool = self._pool_normals
+        return pool[pos] * scale, pool[pos + 1] * scale
+
+    def random(self):
+        """U[0, 1) variate"""
+        pos = self._pool_uniforms_pos
+        if pos >= len(self._pool_uniforms):
+            self._pool_uniforms = self.rng.random(self.block).tolist()
+            pos = 0
+        self._pool_uniforms_pos = pos + 1
+        return self._pool_uniforms[pos]
+
+    def integer(self, low, high):
+        """Integer in [low, high), like np.random.randint"""
+        return low + int(self.random() * (high - low))
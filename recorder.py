@@ -0,0 +1,100 @@
+"""
+Background recording of simulation results
+
+AsyncRecorder takes the place of a ResultWriter in the tick loop: append
+copies the data of the tick (statistics and agent state) and puts it in a
+bounded queue, and a writer thread does the serialization and the
+compression. When the queue is full the policy decides what happens:
+
+    'block'       wait for the writer, every tick is recorded
+    'drop'        discard the tick
+    'downsample'  record one tick out of `stride`, doubled while the queue
+                  is full and halved again once the writer has caught up
+
+Recorded ticks keep their iteration in the 'tick' statistic, so dropped
+ticks show as gaps.
+
+    recorder = AsyncRecorder(ResultWriter('results/run1'), policy='drop')
+    for t in range(ticks):
+        sim.run()
+        recorder.append(sim)
+    recorder.close()
+"""
+
+import queue
+import threading
+
+POLICIES = ('block', 'drop', 'downsample')
+
+
+class AsyncRecorder:
+    """
+    :param writer: ResultWriter (or any object with capture, write and close)
+    :param maxsize: ticks held in the queue
+    :param policy: 'block', 'drop' or 'downsample'
+    """
+    def __init__(self, writer, maxsize=32, policy='block'):
+        if policy not in POLICIES:
+            raise ValueError('unknown policy: {}'.format(policy))
+        self.writer = writer
+        self.maxsize = maxsize
+        self.policy = policy
+        self.stride = 1
+        self.recorded = 0
+        self.dropped = 0
+        self.error = None
+        self._count = 0
+        self._queue = queue.Queue(maxsize)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _run(self):
+        while True:
+            frame = self._queue.get()
+            if frame is None:
+                return
+            # 出错后继续清空队列，避免主线程阻塞
+            if self.error is None:
+                try:
+                    self.writer.write(frame)
+                except BaseException as e:
+                    self.error = e
+
+    def _check(self):
+        if self.error is not None:
+            raise RuntimeError('result writer failed') from self.error
+
+    def append(self, sim):
+        """Queue the current tick of sim, according to the policy"""
+        self._check()
+        if self.policy == 'downsample':
+            if self._queue.qsize() <= self.maxsize // 4 and self.stride > 1:
+                self.stride //= 2
+            self._count += 1
+            if self._count < self.stride:
+                self.dropped += 1
+                return
+            self._count = 0
+        if self.policy != 'block' and self._queue.full():
+            self.dropped += 1
+            if self.policy == 'downsample':
+                self.stride *= 2
+            return
+        self._queue.put(self.writer.capture(sim))
+        self.recorded += 1
+
+    def close(self):
+        """Wait for the queued ticks to be written and close the writer"""
+        try:
+            if self._thread.is_alive():
+                self._queue.put(None)
+                self._thread.join()
+            self._check()
+        finally:
+            self.writer.close()
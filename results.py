@@ -0,0 +1,247 @@
+"""
+Streaming storage of simulation results
+
+ResultWriter appends the statistics of every tick, and optionally the
+state of every agent, to a directory of compressed .npz shards while the
+simulation runs: only one chunk of ticks is kept in memory. Agent state
+is also split in blocks of agents, so ResultReader can slice by tick
+range and by agent without reading the whole run.
+
+    writer = ResultWriter('results/run1', agent_fields=('x', 'y', 'status'))
+    for t in range(ticks):
+        sim.run()
+        writer.append(sim)
+    writer.close()
+
+    reader = ResultReader('results/run1')
+    reader.statistics('Infected', start=0, stop=240)
+    reader.agents('status', agents=[0, 1, 2])
+"""
+
+import json
+import os
+
+import numpy as np
+
+from population import SEVERITY_CODE, STATUS_CODE
+
+FORMAT_VERSION = 2
+
+# 可记录的agent状态及其类型
+AGENT_FIELDS = {
+    'x': np.float32,
+    'y': np.float32,
+    'status': np.uint8,
+    'infected_status': np.uint8,
+    'wealth': np.float32,
+}
+
+
+def agent_state(sim, fields):
+    """State of every agent of sim, {field: array}"""
+    if sim.engine is not None:
+        p = sim.engine.population
+        return {name: getattr(p, name) for name in fields}
+    state = {}
+    for name in fields:
+        if name == 'status':
+            values = [STATUS_CODE[p.status] for p in sim.population]
+        elif name == 'infected_status':
+            values = [SEVERITY_CODE[p.infected_status] for p in sim.population]
+        else:
+            values = [getattr(p, name) for p in sim.population]
+        state[name] = np.array(values, dtype=AGENT_FIELDS[name])
+    return state
+
+
+def _stats_file(chunk):
+    return 'stats_{:06d}.npz'.format(chunk)
+
+
+def _agents_file(chunk, block):
+    return 'agents_{:06d}_{:04d}.npz'.format(chunk, block)
+
+
+class ResultWriter:
+    """
+    :param path: output directory
+    :param statistics: type of get_statistics to record ('all', 'info', ...)
+    :param agent_fields: names of AGENT_FIELDS to record every tick, () for none
+    :param chunk_ticks: ticks per shard, the memory kept is chunk_ticks x agents
+    :param agent_chunk: agents per shard of the agent state
+    """
+    def __init__(self, path, statistics='all', agent_fields=(), chunk_ticks=240,
+                 agent_chunk=65536):
+        for name in agent_fields:
+            if name not in AGENT_FIELDS:
+                raise ValueError('unknown agent field: {}'.format(name))
+        self.path = path
+        self.statistics_type = statistics
+        self.agent_fields = list(agent_fields)
+        self.chunk_ticks = chunk_ticks
+        self.agent_chunk = agent_chunk
+        self.population_size = None
+        self.fields = None
+        self.chunks = []
+        self._ticks = []
+        self._stats = []
+        self._agents = None
+        os.makedirs(path, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def append(self, sim):
+        """Record the current tick of sim"""
+        self.write(self.capture(sim))
+
+    def capture(self, sim):
+        """
+        The data of the current tick of sim, copied so that it is not changed
+        by the next ticks
+        :return: (tick, statistics, {field: array})
+        """
+        stats = sim.get_statistics(self.statistics_type)
+        if self.fields is None:
+            self.fields = list(stats.keys())
+            self.population_size = sim.population_size
+        agents = {name: np.array(values, dtype=AGENT_FIELDS[name])
+                  for name, values in agent_state(sim, self.agent_fields).items()}
+        return sim.iteration, [stats[k] for k in self.fields], agents
+
+    def write(self, frame):
+        """Record a tick returned by capture"""
+        tick, stats, agents = frame
+        self._ticks.append(tick)
+        self._stats.append(stats)
+        if self.agent_fields:
+            if self._agents is None:
+                self._agents = {name: np.zeros((self.chunk_ticks, self.population_size),
+                                               dtype=AGENT_FIELDS[name])
+                                for name in self.agent_fields}
+            row = len(self._ticks) - 1
+            for name, values in agents.items():
+                self._agents[name][row] = values
+        if len(self._ticks) >= self.chunk_ticks:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered ticks as a new chunk"""
+        n = len(self._ticks)
+        if n == 0:
+            return
+        chunk = len(self.chunks)
+        stats = np.array(self._stats, dtype=np.float64).reshape(n, len(self.fields))
+        columns = {k: stats[:, i] for i, k in enumerate(self.fields)}
+        columns['tick'] = np.array(self._ticks, dtype=np.int64)
+        np.savez_compressed(os.path.join(self.path, _stats_file(chunk)), **columns)
+        if self.agent_fields:
+            for block, lo in enumerate(range(0, self.population_size, self.agent_chunk)):
+                hi = lo + self.agent_chunk
+                np.savez_compressed(os.path.join(self.path, _agents_file(chunk, block)),
+                                    **{name: values[:n, lo:hi]
+                                       for name, values in self._agents.items()})
+        # 按tick选择分块: (第一个tick, 最后一个tick, 行数)
+        self.chunks.append([int(self._ticks[0]), int(self._ticks[-1]), n])
+        self._ticks = []
+        self._stats = []
+        self.write_index()
+
+    def write_index(self):
+        index = {
+            'version': FORMAT_VERSION,
+            'statistics': self.fields,
+            'agent_fields': {name: np.dtype(AGENT_FIELDS[name]).name for name in self.agent_fields},
+            'population_size': self.population_size,
+            'agent_chunk': self.agent_chunk,
+            'chunks': self.chunks,
+        }
+        tmp = os.path.join(self.path, 'index.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp, os.path.join(self.path, 'index.json'))
+
+    def close(self):
+        self.flush()
+        self.write_index()
+
+
+class ResultReader:
+    """Reads the directory of a ResultWriter, chunk by chunk"""
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'index.json')) as f:
+            index = json.load(f)
+        if index['version'] != FORMAT_VERSION:
+            raise ValueError('unsupported results version: {}'.format(index['version']))
+        self.fields = index['statistics'] or []
+        self.agent_fields = list(index['agent_fields'])
+        self.population_size = index['population_size']
+        self.agent_chunk = index['agent_chunk']
+        self.chunks = index['chunks']
+        self._ticks = {}
+
+    def __len__(self):
+        """Number of recorded ticks"""
+        return sum(rows for _, _, rows in self.chunks)
+
+    def _chunk_ticks(self, chunk):
+        if chunk not in self._ticks:
+            with np.load(os.path.join(self.path, _stats_file(chunk))) as data:
+                self._ticks[chunk] = data['tick']
+        return self._ticks[chunk]
+
+    def _overlapping(self, start, stop):
+        """(chunk, slice of rows within the chunk) of the recorded ticks in [start, stop)"""
+        for chunk, (first, last, _) in enumerate(self.chunks):
+            if last < start or (stop is not None and first >= stop):
+                continue
+            ticks = self._chunk_ticks(chunk)
+            lo = np.searchsorted(ticks, start, side='left')
+            hi = len(ticks) if stop is None else np.searchsorted(ticks, stop, side='left')
+            if hi > lo:
+                yield chunk, slice(int(lo), int(hi))
+
+    def statistics(self, fields=None, start=0, stop=None):
+        """
+        Statistics of the recorded ticks in [start, stop)
+        :param fields: a name, a list of names, or None for all (and 'tick')
+        :return: array for one name, else {name: array}
+        """
+        names = [fields] if isinstance(fields, str) else \
+            (fields if fields is not None else self.fields + ['tick'])
+        parts = {name: [] for name in names}
+        for chunk, sel in self._overlapping(start, stop):
+            with np.load(os.path.join(self.path, _stats_file(chunk))) as data:
+                for name in names:
+                    parts[name].append(data[name][sel])
+        out = {name: np.concatenate(v) if v else np.zeros(0) for name, v in parts.items()}
+        return out[fields] if isinstance(fields, str) else out
+
+    def agents(self, field, start=0, stop=None, agents=None):
+        """
+        One agent field over the recorded ticks in [start, stop)
+        :param agents: agent indices, None for all
+        :return: array (ticks, agents)
+        """
+        if field not in self.agent_fields:
+            raise KeyError(field)
+        if agents is None:
+            agents = np.arange(self.population_size)
+        agents = np.asarray(agents, dtype=np.int64)
+        blocks = agents // self.agent_chunk
+        rows = []
+        for chunk, sel in self._overlapping(start, stop):
+            ticks = sel.stop - sel.start
+            row = np.zeros((ticks, len(agents)), dtype=AGENT_FIELDS[field])
+            for block in np.unique(blocks):
+                mask = blocks == block
+                with np.load(os.path.join(self.path, _agents_file(chunk, block))) as data:
+                    row[:, mask] = data[field][sel][:, agents[mask] - block * self.agent_chunk]
+            rows.append(row)
+        if not rows:
+            return np.zeros((0, len(agents)), dtype=AGENT_FIELDS[field])
+        return np.concatenate(rows)
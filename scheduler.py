@@ -0,0 +1,82 @@
+"""
+Event scheduler for the progression of infections
+
+Infection schedules the future events of an agent (its contagious
+window and its recovery), so the daily update only touches the agents
+whose events are due. Time is counted in days.
+"""
+
+import heapq
+import itertools
+
+# 事件类型
+CONTAGIOUS = 0  # 传染概率改变
+RECOVERY = 1    # 痊愈
+
+
+def contagious_probability(t, incubation_time, contagion_time):
+    """
+    Probability that an agent infected for t days transmits on contact
+
+    Simulator.contact used to test incubation_time + low <= t <=
+    contagion_time + up, with low and up uniform on {-1, 0}: both bounds
+    are fuzzy by one day.
+    :return: 0, 0.25, 0.5 or 1
+    """
+    if t >= incubation_time:
+        p_low = 1.0
+    elif t == incubation_time - 1:
+        p_low = 0.5
+    else:
+        p_low = 0.0
+    if t <= contagion_time - 1:
+        p_up = 1.0
+    elif t == contagion_time:
+        p_up = 0.5
+    else:
+        p_up = 0.0
+    return p_low * p_up
+
+
+def contagious_changes(incubation_time, contagion_time):
+    """Infected times at which contagious_probability may change"""
+    return sorted({incubation_time - 1, incubation_time, contagion_time, contagion_time + 1})
+
+
+class EventScheduler:
+    """
+    Priority queue of (time, event, agent)
+
+    Events of the same time are popped in scheduling order. Cancelling an
+    agent invalidates all its pending events, they are dropped when popped.
+    """
+    def __init__(self):
+        self.heap = []
+        self.version = {}
+        self.counter = itertools.count()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def schedule(self, time, event, agent):
+        heapq.heappush(self.heap, (time, next(self.counter), event, agent,
+                                   self.version.get(agent, 0)))
+
+    def cancel(self, agent):
+        self.version[agent] = self.version.get(agent, 0) + 1
+
+    def pop_due(self, time):
+        """
+        Remove the events due at or before time
+        :return: list of (time, event, agent)
+        """
+        due = []
+        while self.heap and self.heap[0][0] <= time:
+            t, _, event, agent, version = heapq.heappop(self.heap)
+            if version == self.version.get(agent, 0):
+                due.append((t, event, agent))
+        return due
+
+    def clear(self):
+        self.heap = []
+        self.version = {}
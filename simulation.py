@@ -1,10 +1,38 @@
+import copy
+from collections import Counter
+
 import numpy as np
 from agent import InfectionSeverity, Person, Business, Government, House, HealthCare, Status
 from common_data import *
 from util import *
+from spatial import neighbour_pairs, PointIndex
+from population import ArrayEngine, SEVERITY_CODE, build_population, \
+    daily_transitions, ration
+from randomness import DirectRandom, RandomBuffer
+from checkpoint import load_checkpoint, save_checkpoint
+from eventlog import INFECTION, EventLog
+from popcache import cached_population
+from scheduler import CONTAGIOUS, RECOVERY, EventScheduler, contagious_changes, contagious_probability
 
 class Simulator:
     def __init__(self, **kwargs):
+        # 随机数: 每个Simulator独立的Generator，seed可以是int或SeedSequence
+        self.seed = kwargs.get("seed", None)
+        if isinstance(self.seed, np.random.SeedSequence):
+            self.seed_sequence = self.seed
+        else:
+            self.seed_sequence = np.random.SeedSequence(self.seed)
+        self.rng = np.random.default_rng(self.seed_sequence)
+        # 构造参数，checkpoint中保存 (见checkpoint.py)
+        self.parameters = dict(kwargs)
+        # 每checkpoint_every个tick写入一次checkpoint_path，0为不写
+        self.checkpoint_every = kwargs.get("checkpoint_every", 0)
+        self.checkpoint_path = kwargs.get("checkpoint_path", "checkpoint.npz")
+        # 事件记录 (感染、死亡、解雇): 文件路径或EventLog，None为不记录 (见eventlog.py)
+        self.events = kwargs.get("event_log", None)
+        if isinstance(self.events, str):
+            self.events = EventLog(self.events)
+        
         self.population = []
         self.houses = []
         self.total_business = kwargs.get('total_business', 10)
@@ -13,9 +41,10 @@ class Simulator:
         self.business_distance = kwargs.get('business_distance', 10)
         
         # 社会结构参数
+        # 分布函数可接受size参数以批量抽样 (见population.sample)
         ## 1.财富层级分布
         self.social_stratum = kwargs.get('social_stratum',
-                                         lambda: int(np.random.rand(1) * 100 // 20))
+                                         lambda size=None: self.rng.integers(0, 5, size))
         ## 2.流浪比例
         self.homeless_rate = kwargs.get("homeless_rate", 0.0005)
         ## 3.失业率
@@ -25,7 +54,7 @@ class Simulator:
         self.homemates_std = kwargs.get("homemates_std", 1)
         ## 5.年龄分布
         self.age_distribution = kwargs.get("age_distribution",
-                                           lambda: int(np.random.beta(2, 5, 1) * 100))
+                                           lambda size=None: np.int64(self.rng.beta(2, 5, size) * 100))
         ## 6.人口数量
         self.population_size = kwargs.get("population_size", 20)
         ## 7.政府财政收入比
@@ -40,6 +69,10 @@ class Simulator:
         self.minimum_expense = kwargs.get("minimum_expense", 600.0)
         ## 12.医疗系统的承载能力 x%的总人口
         self.critical_limit = kwargs.get("critical_limit", 0.05)
+        ## 13.人口缓存目录 (见popcache.py)，自定义的分布函数无法缓存
+        self.population_cache = kwargs.get("population_cache", None)
+        if "social_stratum" in kwargs or "age_distribution" in kwargs:
+            self.population_cache = None
         
         # 传染病人群参数
         ## 初始感染率
@@ -61,6 +94,8 @@ class Simulator:
         self.contagion_distance = kwargs.get("contagion_distance", 1.)
         ## 小于安全距离的传染率
         self.contagion_rate = kwargs.get("contagion_rate", 0.9)
+        ## 接触检测方式: 'grid' 空间网格索引, 'brute_force' 两两遍历
+        self.contagion_index = kwargs.get("contagion_index", 'grid')
         
         
         # 仿真时空参数
@@ -70,8 +105,38 @@ class Simulator:
         self.num_month = 0
         self.num_day = 0
         self.statistics = None
-        # 回调函数，用于实施干预措施
-        self.callbacks = kwargs.get("callbacks", {})
+        # 各(Status, InfectionSeverity)人数，随状态变化增量更新
+        self.counts = Counter()
+        # 失业、无家可归人员 {index: Person}，随状态变化增量更新
+        self.unemployed = {}
+        self.homeless = {}
+        # 感染人员 {index: Person} 和感染进程的事件 (传染期、痊愈)
+        self.infected = {}
+        self.scheduler = EventScheduler()
+        # 已完成的每日更新次数，感染事件的时钟
+        self.day = 0
+        # 财富统计每个tick最多计算一次
+        self._wealth_iteration = None
+        # 人群分组 (隔离、高风险等)，按agent index存为布尔数组
+        self.groups = {}
+        # 仿真引擎: 'object' 逐个Person对象, 'array' 数组化的人口 (见population.py)
+        self.engine_type = kwargs.get("engine", 'object')
+        self.engine = None
+        # array引擎保留每个tick的转账记录 (engine.ledger.dump())
+        self.record_transfers = kwargs.get("record_transfers", False)
+        # 干预措施按人口整体计算 (on_population_move) 只用于array引擎:
+        # object引擎每个tick把Person对象转为数组，比逐个调用on_person_move更慢
+        self.vectorized_policies = self.engine_type == 'array'
+        # 回调函数，用于实施干预措施 (scenario优先，见interventions.Scenario)
+        self.scenario = kwargs.get("scenario", None)
+        self.callbacks = self.compile_callbacks(**kwargs)
+        # 每个tick批量生成随机数，False则逐次调用Generator
+        if kwargs.get("batched_random", True):
+            self.random = RandomBuffer(self.rng)
+        else:
+            self.random = DirectRandom(self.rng)
+        # 公司位置索引 (公司创建后不再移动)
+        self.business_index = None
         
         # 政府和医院
         margin = 0.01
@@ -82,35 +147,110 @@ class Simulator:
         self.quarantine_x = self.width*(1 - margin)
         self.quarantine_y = self.height*margin
     
+    def compile_callbacks(self, **kwargs):
+        if self.scenario is not None:
+            callbacks = self.scenario.compile(self)
+        else:
+            callbacks = kwargs.get("callbacks", {})
+        if self.engine_type == 'array' and 'on_person_move' in callbacks:
+            raise ValueError("engine='array' does not support on_person_move, "
+                             "use on_population_move")
+        if self.engine_type != 'array' and 'on_population_move' in callbacks:
+            raise ValueError("on_population_move requires engine='array'")
+        return callbacks
+
+    def group(self, name):
+        """Membership mask of a group of persons, by index (empty if unknown)"""
+        if name not in self.groups:
+            self.groups[name] = np.zeros(self.population_size, dtype=bool)
+        return self.groups[name]
+
+    def add_group(self, name, mask):
+        self.groups[name] = np.asarray(mask, dtype=bool)
+
     def create_agent(self, status, infected_time=0):
         age = self.age_distribution()
         social_stratum = self.social_stratum()
         p = Person(
             age=age, status=status, social_stratum=social_stratum,
             infected_time=infected_time,
+            index=len(self.population),
             environment=self
         )
+        return self.add_agent(p)
+
+    def add_agent(self, p):
+        """Append a Person and register it in the counters and registries"""
         self.population.append(p)
+        self.counts[(p.status, p.infected_status)] += 1
+        self.update_registries(p)
+        if p.status == Status.Infected:
+            self.infected[p.index] = p
+            self.schedule_infection(p)
         return p
+
+    def person_transition(self, p, old_status, old_severity):
+        """Called by Person when its status or infected_status changes"""
+        self.counts[(old_status, old_severity)] -= 1
+        self.counts[(p.status, p.infected_status)] += 1
+        self.update_registries(p)
+        if p.status == Status.Infected and old_status != Status.Infected:
+            self.infected[p.index] = p
+            self.schedule_infection(p)
+        elif p.status != Status.Infected and old_status == Status.Infected:
+            del self.infected[p.index]
+            self.scheduler.cancel(p.index)
+            p.contagiousness = 0.0
+
+    def schedule_infection(self, p):
+        """Schedule the changes of the contagious window and the recovery of an infected person"""
+        self.scheduler.cancel(p.index)
+        t = p.infected_time
+        since = self.day - t
+        p.contagiousness = contagious_probability(t, self.incubation_time, self.contagion_time)
+        for change in contagious_changes(self.incubation_time, self.contagion_time):
+            if since + change > self.day:
+                self.scheduler.schedule(since + change, CONTAGIOUS, p.index)
+        self.scheduler.schedule(max(since + self.recovering_time + 1, self.day + 1),
+                                RECOVERY, p.index)
+
+    def update_registries(self, p):
+        eligible = p.status != Status.Death and \
+            p.infected_status == InfectionSeverity.Asymptomatic
+        for registry, member in ((self.unemployed, eligible and p.employer is None),
+                                 (self.homeless, eligible and p.house is None)):
+            if member:
+                registry[p.index] = p
+            else:
+                registry.pop(p.index, None)
     
     def create_house(self, social_stratum=None):
         x, y = self.random_position()
         if social_stratum is None:
             social_stratum = self.social_stratum()
         self.houses.append(House(x=x, y=y,
-                                 social_stratum=social_stratum))
+                                 social_stratum=social_stratum,
+                                 index=len(self.houses),
+                                 environment=self))
 
     def create_business(self):
         x, y = self.random_position()
         social_stratum = self.social_stratum()
         self.business.append(Business(x=x, y=y,
-                                      social_stratum=social_stratum))
+                                      social_stratum=social_stratum,
+                                      index=len(self.business),
+                                      environment=self))
 
     def intervention_initialize(self, **kwargs):
+        # 重置的感染人员会重新安排事件
+        self.scheduler.clear()
+        if self.events is not None:
+            self.events.clear()
         self.iteration = 0
         self.num_month = 0
         self.num_day = 0
         self.statistics = None
+        self._wealth_iteration = None
         
         ## 初始感染率
         self.initial_infected_perc = kwargs.get("initial_infected_perc", 0.05)
@@ -122,10 +262,20 @@ class Simulator:
         self.contagion_rate = kwargs.get("contagion_rate", 0.9)
         
         # 回调函数，用于实施干预措施
-        self.callbacks = kwargs.get("callbacks", {})
+        self.scenario = kwargs.get("scenario", None)
+        self.callbacks = self.compile_callbacks(**kwargs)
         
         self.government.wealth = self.total_wealth * self.public_gdp_share
         
+        if self.engine is not None:
+            self.healthcare.size = 0
+            self.healthcare.expenses = 0
+            self.healthcare.wealth = 0
+            self.engine.reset()
+            if 'post_initialize' in self.callbacks.keys():
+                self.callbacks['post_initialize'](self)
+            return
+        
         # reset wealth distribution
         for quintile in range(5):
             if self.total_business > 5:
@@ -189,86 +339,79 @@ class Simulator:
         if 'post_initialize' in self.callbacks.keys():
             self.callbacks['post_initialize'](self)
         
-    def initialize(self):    
-        # 创建家庭
-        for i in range(int(self.population_size / self.homemates_avg)):
-            self.create_house(social_stratum=i%5)
-        # 创建公司
-        for i in range(self.total_business):
-            self.create_business()
-        
-        # 创建 初始感染人群
-        for i in range(int(self.population_size * self.initial_infected_perc)):
-            self.create_agent(Status.Infected, infected_time=5)
-        # 创建 初始免疫人群
-        for i in range(int(self.population_size * self.initial_immune_perc)):
-            self.create_agent(Status.Recovered_Immune)
-        # 创建 易感人群
-        for i in range(self.population_size - len(self.population)):
-            self.create_agent(Status.Susceptible)
-        
-        # 分配社会总财富
-        ## 1.政府财政
-        self.government.wealth = self.total_wealth * self.public_gdp_share
-        ## 按财富等级分配
-        for quintile in range(5):
-            ## 2.分配给公司
-            if self.total_business > 5:
-                btotal = lorenz_curve[quintile] * (self.total_wealth * self.business_gdp_share)
-                bqty = max(1.0,
-                           np.sum([1.0 for a in self.business if a.social_stratum == quintile]))
-            else:
-                btotal = self.total_wealth * self.business_gdp_share
-                bqty = self.total_business
-            share = btotal / bqty
-            for b in filter(lambda x: x.social_stratum == quintile,
-                            self.business):
-                b.wealth = share
-            ## 3.分配给个人
-            ptotal = lorenz_curve[quintile] * self.total_wealth * \
-                (1 - (self.public_gdp_share + self.business_gdp_share))
-            pqty = max(1.0, np.sum([1 for a in self.population if
-                                   a.social_stratum == quintile and a.economical_status == 1]))
-            share = ptotal / pqty
-            # （都遍历每个人了，顺便设置这个人的各个状态吧）
-            ## 先筛选出这个quintile的家庭，方便后面分配
-            _houses = [x for x in filter(lambda x: x.social_stratum == quintile, self.houses)]
-            nhouses = len(_houses)
-            ## 要保证每个财富级别至少有一个家庭
-            if nhouses == 0:
-                self.create_house(social_stratum=quintile)
-                _houses = [self.houses[np.random.randint(0, len(self.houses))]]
-                nhouses = 1
-                
-            for p in filter(lambda x: x.social_stratum == quintile, self.population):
-                if p.economical_status == 1:
-                    p.wealth = share
-                    p.incomes = basic_income[p.social_stratum] * self.minimum_income
-                    ## 随机指定为某公司员工
-                    unemployed_test = np.random.rand()
-                    if unemployed_test >= self.unemployment_rate:
-                        ix = np.random.randint(0, self.total_business)
-                        self.business[ix].hire(p)
-                ## 日开销
-                p.expenses = basic_income[p.social_stratum] * self.minimum_expense
-                
-                ## 给他一个家
-                homeless_test = np.random.rand()
-                if not (quintile == 0 and homeless_test <= self.homeless_rate):
-                    for kp in range(6):
-                        # 先尝试塞进去
-                        ix = np.random.randint(0, nhouses)
-                        if _houses[ix].size < self.homemates_avg + self.homemates_std:
-                            _houses[ix].append_mate(p)
-                            continue
-                    # 如果人满了 就随便塞吧
-                    if p.house is None:
-                        ix = np.random.randint(0, len(self.houses))
-                        self.houses[ix].append_mate(p)
+    def initialize(self):
+        if self.events is not None:
+            self.events.clear()
+        if self.population_cache is not None:
+            tables = cached_population(self, self.population_cache)
+        else:
+            tables = build_population(self)
+        if self.engine_type == 'array':
+            # 人口直接以数组表示，不创建Python对象
+            self.engine = ArrayEngine(self, record_transfers=self.record_transfers)
+            self.engine.load(*tables)
+            business = self.engine.business
+        else:
+            self.create_agents(*tables)
+            business = tables[2]
+        self.business_index = PointIndex(business.x, business.y, self.business_distance)
         
         if 'post_initialize' in self.callbacks.keys():
             self.callbacks['post_initialize'](self)
 
+    def create_agents(self, population, houses, business):
+        """
+        Create the agent objects from tables, built by build_population
+        or saved by a checkpoint
+        """
+        h = houses.columns()
+        h = {name: values.tolist() for name, values in h.items()}
+        for i in range(len(houses)):
+            house = House(x=h['x'][i], y=h['y'][i], social_stratum=h['social_stratum'][i],
+                          wealth=h['wealth'][i], index=i, environment=self)
+            house.size = h['size'][i]
+            house.incomes = h['incomes'][i]
+            house.expenses = h['expenses'][i]
+            house.fixed_expenses = h['fixed_expenses'][i]
+            self.houses.append(house)
+        b = {name: values.tolist() for name, values in business.columns().items()}
+        for i in range(len(business)):
+            bus = Business(x=b['x'][i], y=b['y'][i], social_stratum=b['social_stratum'][i],
+                           wealth=b['wealth'][i], price=b['price'][i],
+                           index=i, environment=self)
+            bus.incomes = b['incomes'][i]
+            bus.expenses = b['expenses'][i]
+            bus.fixed_expense = b['fixed_expense'][i]
+            bus.open = b['open'][i]
+            bus.stocks = b['stocks'][i]
+            bus.sales = b['sales'][i]
+            self.business.append(bus)
+        statuses = list(Status)
+        severities = list(InfectionSeverity)
+        p = {name: values.tolist() for name, values in population.columns().items()}
+        for i in range(len(population)):
+            person = Person(age=p['age'][i],
+                            status=statuses[p['status'][i]],
+                            infected_status=severities[p['infected_status'][i]],
+                            social_stratum=p['social_stratum'][i],
+                            infected_time=p['infected_time'][i],
+                            income=p['incomes'][i],
+                            expense=p['expenses'][i],
+                            wealth=p['wealth'][i],
+                            x=p['x'][i], y=p['y'][i],
+                            index=i, environment=self)
+            if p['house'][i] >= 0:
+                person.house = self.houses[p['house'][i]]
+                # 死者仍指向原来的家，但已不是家庭成员
+                if person.status != Status.Death:
+                    person.house.homemates.append(person)
+            if p['employer'][i] >= 0:
+                bus = self.business[p['employer'][i]]
+                bus.employees[i] = person
+                bus.num_employees += 1
+                person.employer = bus
+            self.add_agent(person)
+
     def run(self):
         if new_day(self.iteration):
             if self.iteration > 1:
@@ -283,11 +426,21 @@ class Simulator:
             new_m = True
         else:
             new_m = False
-            
+        
+        if self.engine is not None:
+            self.engine.step(new_d, new_m)
+            self.iteration += 1
+            self.auto_checkpoint()
+            return
+        
         # 个人活动
         for p in filter(lambda x: x.status != Status.Death, self.population):
             
-            if not self.callbacks['on_person_move'](p):
+            if 'on_person_move' in self.callbacks:
+                skip = self.callbacks['on_person_move'](p)
+            else:
+                skip = False
+            if not skip:
                 if bed_time(self.iteration):
                     # 睡觉
                     p.move_to_home(self.amplitudes)
@@ -299,15 +452,12 @@ class Simulator:
                     # 搬砖
                     p.move_to_work(self.amplitudes)
             
-            # 消费 (可能包含满足基本生活的消费，lockdown下满足距离的个体依然会有经济活动)
-            if p.infected_status == InfectionSeverity.Asymptomatic:
-                for b in filter(lambda x: x != p.employer, self.business):
-                    if distance(p, b) <= self.business_distance:
-                        b.supply(p)
+        # 消费 (可能包含满足基本生活的消费，lockdown下满足距离的个体依然会有经济活动)
+        self.clear_market()
 
-            # 状态更新daily
-            if new_d:
-                p.update(self)
+        # 状态更新daily
+        if new_d:
+            self.daily_update()
         
         # 公司活动
         for bus in filter(lambda b: b.open, self.business):
@@ -334,6 +484,114 @@ class Simulator:
             for h in self.houses:
                 h.accounting(self)
         
+        # 传染
+        if self.contagion_index == 'grid':
+            self.contagion_grid()
+        else:
+            self.contagion_brute_force()
+        
+        self.iteration += 1
+        self.auto_checkpoint()
+
+    def auto_checkpoint(self):
+        if self.checkpoint_every and self.iteration % self.checkpoint_every == 0:
+            self.checkpoint(self.checkpoint_path)
+
+    def checkpoint(self, path):
+        """Save the complete state of the simulation to path (see checkpoint.py)"""
+        save_checkpoint(self, path)
+
+    @classmethod
+    def resume(cls, path, **kwargs):
+        """
+        Continue a simulation from a checkpoint, exactly as if it had not stopped
+        :param kwargs: parameters that can not be saved, e.g. callbacks
+        :return: Simulator
+        """
+        return load_checkpoint(cls, path, **kwargs)
+
+    def daily_update(self):
+        """
+        Daily progression of the infected population, computed with
+        daily_transitions; the contagious window and the recovery of
+        every infected person come from its scheduled events
+        """
+        self.day += 1
+        recovering = set()
+        for _, event, index in self.scheduler.pop_due(self.day):
+            p = self.population[index]
+            if event == CONTAGIOUS:
+                p.contagiousness = contagious_probability(p.infected_time, self.incubation_time,
+                                                          self.contagion_time)
+            elif event == RECOVERY:
+                recovering.add(index)
+        infected = [self.infected[i] for i in sorted(self.infected)]
+        occupied = sum(self.counts[(s, i)] for s in Status if s != Status.Death
+                       for i in (InfectionSeverity.Hospitalization, InfectionSeverity.Severe))
+        t = daily_transitions(
+            np.array([SEVERITY_CODE[p.infected_status] for p in infected], dtype=np.uint8),
+            np.array([p.index in recovering for p in infected], dtype=bool),
+            (np.array([p.hospitalization_prob for p in infected]),
+             np.array([p.severe_prob for p in infected]),
+             np.array([p.death_prob for p in infected])),
+            self.rng.random((len(infected), 2)), occupied,
+            self.population_size, self.critical_limit)
+        for k in np.flatnonzero(t.to_hospital):
+            infected[k].infected_status = InfectionSeverity.Hospitalization
+            infected[k].move_to_healthcare(self.healthcare)
+        for k in np.flatnonzero(t.to_severe):
+            infected[k].infected_status = InfectionSeverity.Severe
+        for k in np.flatnonzero(t.dies):
+            infected[k].after_death()
+        for k in np.flatnonzero(t.recovers):
+            p = infected[k]
+            if p.infected_status == InfectionSeverity.Hospitalization:
+                self.healthcare.size -= 1
+            p.status = Status.Recovered_Immune
+            p.infected_status = InfectionSeverity.Asymptomatic
+            p.infected_time = 0
+
+    def clear_market(self):
+        """
+        Hourly consumption of the whole population in one batch: every
+        person buys from the business nearby (but its employer), each
+        business serves its buyers in population order until out of stock
+        """
+        buyers = [p for p in self.population if p.status != Status.Death and
+                  p.infected_status == InfectionSeverity.Asymptomatic]
+        if len(buyers) == 0:
+            return
+        src, bix = self.business_index.query_many([p.x for p in buyers],
+                                                  [p.y for p in buyers])
+        employer = np.array([-1 if p.employer is None else p.employer.index for p in buyers])
+        keep = employer[src] != bix
+        src = src[keep]
+        bix = bix[keep]
+        if len(bix) == 0:
+            return
+        sellers = np.unique(bix)
+        stocks = np.zeros(self.total_business, dtype=np.int64)
+        price = np.zeros(self.total_business)
+        for ix in sellers:
+            stocks[ix] = self.business[ix].stocks
+            price[ix] = self.business[ix].price
+        stratum = np.array([p.social_stratum for p in buyers])
+        qty = ration(bix, self.rng.integers(1, 10, len(bix)), stocks)
+        value = price[bix] * stratum[src] * qty
+        # 一次结算: 每个买家、每个公司各更新一次
+        spent = np.bincount(src, weights=value, minlength=len(buyers))
+        for i in np.unique(src):
+            buyers[i].demand(spent[i])
+        sold = np.bincount(bix, weights=qty, minlength=self.total_business)
+        income = np.bincount(bix, weights=value, minlength=self.total_business)
+        for ix in sellers:
+            b = self.business[ix]
+            b.wealth += income[ix]
+            b.incomes += income[ix]
+            b.stocks -= int(sold[ix])
+            b.sales += int(sold[ix])
+
+    def contagion_brute_force(self):
         for i in range(self.population_size):
             for j in range(i + 1, self.population_size):
                 pi = self.population[i]
@@ -343,49 +601,73 @@ class Simulator:
                 if distance(pi, pj) <= self.contagion_distance:
                     self.contact(pi, pj)
                     self.contact(pj, pi)
-        
-        self.iteration += 1
+
+    def contagion_grid(self):
+        # 与两两遍历的接触顺序一致，因此相同随机种子下结果完全相同
+        alive = [p for p in self.population if p.status != Status.Death]
+        xs = np.array([p.x for p in alive], dtype=float)
+        ys = np.array([p.y for p in alive], dtype=float)
+        for i, j in zip(*neighbour_pairs(xs, ys, self.contagion_distance)):
+            pi = alive[i]
+            pj = alive[j]
+            self.contact(pi, pj)
+            self.contact(pj, pi)
         
     def contact(self, agent1, agent2):
         if (agent1.status == Status.Susceptible) and (agent2.status == Status.Infected):
-            low = np.random.randint(-1, 1)
-            up = np.random.randint(-1, 1)
-            if agent2.infected_time >= self.incubation_time + low \
-                    and agent2.infected_time <= self.contagion_time + up:
-                contagion_test = np.random.random()
+            # 传染期的上下限各有一天的不确定 (见scheduler.contagious_probability)
+            contagious = agent2.contagiousness
+            if contagious >= 1.0 or (contagious > 0.0 and self.random.random() < contagious):
+                contagion_test = self.random.random()
                 if contagion_test <= self.contagion_rate:
                     agent1.status = Status.Infected
                     agent1.infection_status = InfectionSeverity.Asymptomatic
+                    if self.events is not None:
+                        self.events.log(self.iteration, INFECTION, agent1.index, agent2.index,
+                                        agent2.infected_time)
  
     def get_statistics(self, type='info'):
+        if self.engine is not None:
+            self.statistics = self.engine.statistics()
+            return self.filter_statistics(type)
         if self.statistics is None:
             self.statistics = {}
         # SIR 各个人群的占比
         for s in Status:
-            self.statistics[s.name] = np.sum(
-                [1 for p in self.population if p.status == s]
+            self.statistics[s.name] = sum(
+                self.counts[(s, i)] for i in InfectionSeverity
             ) / self.population_size
         # 感染人群的各情况占比
-        for s in filter(lambda x: x!= InfectionSeverity.Exposed, InfectionSeverity):
-            self.statistics[s.name] = np.sum(
-                [1 for p in self.population if p.infected_status == s and \
-                    p.status != Status.Death]
+        for i in filter(lambda x: x!= InfectionSeverity.Exposed, InfectionSeverity):
+            self.statistics[i.name] = sum(
+                self.counts[(s, i)] for s in Status if s != Status.Death
             ) / self.population_size
+        # 财富统计需要遍历人口，每个tick最多计算一次
+        if type != 'info' and self._wealth_iteration != self.iteration:
+            self.wealth_statistics()
+        
+        # 医院
+        self.statistics['Hospital'] = np.clip(self.healthcare.size/self.healthcare.limitation,0.01,1)
+        return self.filter_statistics(type)
+
+    def wealth_statistics(self):
         # 分财富等级的财富总量
+        quintiles = np.zeros(5)
+        person_wealth = 0.0
+        for p in self.population:
+            person_wealth += p.wealth
+            if p.age >= 18 and p.status != Status.Death:
+                quintiles[p.social_stratum] += p.wealth
         for q in range(5):
-            self.statistics['Q{}'.format(q + 1)] = np.sum(
-                [p.wealth for p in self.population if p.social_stratum == q and p.age >= 18 \
-                    and p.status != Status.Death]
-            )
+            self.statistics['Q{}'.format(q + 1)] = quintiles[q]
         
         # 各类型财富占社会财富之比
         self.statistics['W_Business'] = np.sum([b.wealth for b in self.business])/self.total_wealth
-        self.statistics['W_Person'] = np.sum([p.wealth for p in self.population])/self.total_wealth
+        self.statistics['W_Person'] = person_wealth/self.total_wealth
         self.statistics['W_Government'] = self.government.wealth/self.total_wealth
-        
-        # 医院
-        self.statistics['Hospital'] = np.clip(self.healthcare.size/self.healthcare.limitation,0.01,1)
+        self._wealth_iteration = self.iteration
 
+    def filter_statistics(self, type='info'):
         if type == 'info':
             return {k: v for k, v in self.statistics.items() if not k.startswith('Q') \
                     and not k.startswith('W')}
@@ -398,12 +680,14 @@ class Simulator:
             return {k: v for k, v in self.statistics.items() if not k.startswith('Q')}
     
     def get_unemployed(self):
-        return [p for p in self.population if (p.employer is None)
-                and p.status != Status.Death and p.infected_status == InfectionSeverity.Asymptomatic]
+        if self.engine is not None:
+            return self.engine.unemployed()
+        return [self.unemployed[i] for i in sorted(self.unemployed)]
 
     def get_homeless(self):
-        return [p for p in self.population if (p.house is None)
-                and p.status != Status.Death and p.infected_status == InfectionSeverity.Asymptomatic]
+        if self.engine is not None:
+            return self.engine.homeless()
+        return [self.homeless[i] for i in sorted(self.homeless)]
             
     def _xclip(self, x):
         return np.clip(int(x), 0, self.width)
@@ -411,7 +695,60 @@ class Simulator:
     def _yclip(self, y):
         return np.clip(int(y), 0, self.height)
     
+    def snapshot(self):
+        """
+        Copy of the complete state of the simulation: agents (or the
+        arrays of the array engine), random generator, counters, event
+        queue and calendar. The static business index and the scenario
+        are shared with the copy.
+        """
+        memo = {id(self.business_index): self.business_index}
+        if self.scenario is not None:
+            memo[id(self.scenario)] = self.scenario
+        return copy.deepcopy(self, memo)
+
+    def fork(self, scenario=None):
+        """
+        Independent copy of the simulation, that continues from the current tick
+        The fork starts from the same random state, so branches only
+        differ by their policies: the post_initialize callback of a new
+        scenario draws from a separate stream spawned from the seed, the
+        same for every fork of this simulation.
+        :param scenario: Scenario whose policy the fork applies from now on
+            (its post_initialize callback runs on the fork, its simulation
+            parameters are not applied), None to keep the current policy
+        :return: Simulator
+        """
+        child = self.snapshot()
+        if scenario is not None:
+            child.scenario = scenario
+            child.callbacks = child.compile_callbacks()
+            if 'post_initialize' in child.callbacks.keys():
+                rng = child.rng
+                child.rng = np.random.default_rng(child.seed_sequence.spawn(1)[0])
+                try:
+                    child.callbacks['post_initialize'](child)
+                finally:
+                    child.rng = rng
+        return child
+
+    def random_positions(self, n):
+        """n random positions, as x and y arrays"""
+        x = np.clip(np.trunc(self.width / 2 + self.rng.standard_normal(n) * (self.width / 3)),
+                    0, self.width)
+        y = np.clip(np.trunc(self.height / 2 + self.rng.standard_normal(n) * (self.height / 3)),
+                    0, self.height)
+        return x, y
+
     def random_position(self):
-        x = self._xclip(self.width / 2 + (np.random.randn(1) * (self.width / 3)))
-        y = self._yclip(self.height / 2 + (np.random.randn(1) * (self.height / 3)))
-        return x, y
\ No newline at end of file
+        x = self._xclip(self.width / 2 + (self.rng.standard_normal() * (self.width / 3)))
+        y = self._yclip(self.height / 2 + (self.rng.standard_normal() * (self.height / 3)))
+        return x, y
+
+    def spawn_seeds(self, n):
+        """
+        Independent child seeds for n replicas of this simulation
+        :param n: int
+        :return: list of np.random.SeedSequence, usable as the seed of a Simulator
+        """
+        return self.seed_sequence.spawn(n)
\ No newline at end of file
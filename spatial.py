@@ -0,0 +1,118 @@
+"""
+Spatial indexes used to find agents close to each other
+"""
+
+import numpy as np
+
+# 半邻域：自身格子 + 右/上方向的4个格子，每对相邻格子只检查一次
+_HALF_STENCIL = [(0, 0), (1, -1), (1, 0), (1, 1), (0, 1)]
+
+
+def _expand_ranges(lo, hi):
+    """Concatenate the integer ranges [lo[k], hi[k]) into one flat array"""
+    counts = hi - lo
+    total = counts.sum()
+    starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+    return np.arange(total) + starts, counts
+
+
+def neighbour_pairs(x, y, radius):
+    """
+    Find every pair of points closer than (or exactly at) radius
+
+    Uses a uniform grid with cell size = radius, so only points in the
+    same or neighbouring cells are compared.
+    :param x: array of x coordinates
+    :param y: array of y coordinates
+    :param radius: float, distance threshold
+    :return: (i, j) index arrays with i < j, in lexicographic order
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n < 2:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    cell = radius if radius > 0 else 1.0
+    cx = np.floor(x / cell).astype(np.int64)
+    cy = np.floor(y / cell).astype(np.int64)
+    cx -= cx.min()
+    # 留出 dy=-1 的余量
+    cy -= cy.min() - 1
+    ny = cy.max() + 2
+    key = cx * ny + cy
+
+    order = np.argsort(key, kind='stable')
+    skey = key[order]
+    src_all = []
+    dst_all = []
+    for dx, dy in _HALF_STENCIL:
+        target = key + dx * ny + dy
+        lo = np.searchsorted(skey, target, side='left')
+        hi = np.searchsorted(skey, target, side='right')
+        flat, counts = _expand_ranges(lo, hi)
+        src = np.repeat(np.arange(n), counts)
+        dst = order[flat]
+        if dx == 0 and dy == 0:
+            keep = src < dst
+            src = src[keep]
+            dst = dst[keep]
+        src_all.append(src)
+        dst_all.append(dst)
+    src = np.concatenate(src_all)
+    dst = np.concatenate(dst_all)
+
+    near = np.sqrt((x[src] - x[dst]) ** 2 + (y[src] - y[dst]) ** 2) <= radius
+    i = np.minimum(src[near], dst[near])
+    j = np.maximum(src[near], dst[near])
+    order = np.lexsort((j, i))
+    return i[order], j[order]
+
+
+class PointIndex:
+    """
+    Grid index over points that never move (e.g. business), cell size = radius
+    """
+    def __init__(self, x, y, radius):
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.radius = radius
+        self.cell = radius if radius > 0 else 1.0
+        key = self._key(*self._cells(self.x, self.y))
+        self.order = np.argsort(key, kind='stable')
+        self.keys = key[self.order]
+
+    def _cells(self, x, y):
+        cx = np.floor(np.asarray(x, dtype=float) / self.cell).astype(np.int64)
+        cy = np.floor(np.asarray(y, dtype=float) / self.cell).astype(np.int64)
+        return cx, cy
+
+    @staticmethod
+    def _key(cx, cy):
+        return cx * (2 ** 32) + (cy + 2 ** 31)
+
+    def query_many(self, x, y):
+        """
+        All (query, point) pairs within radius
+        :return: (query index, point index) arrays, sorted by point then query
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        cx, cy = self._cells(x, y)
+        src_all = []
+        dst_all = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                target = self._key(cx + dx, cy + dy)
+                lo = np.searchsorted(self.keys, target, side='left')
+                hi = np.searchsorted(self.keys, target, side='right')
+                flat, counts = _expand_ranges(lo, hi)
+                src_all.append(np.repeat(np.arange(len(x)), counts))
+                dst_all.append(self.order[flat])
+        src = np.concatenate(src_all)
+        dst = np.concatenate(dst_all)
+        near = np.sqrt((x[src] - self.x[dst]) ** 2 + (y[src] - self.y[dst]) ** 2) <= self.radius
+        src = src[near]
+        dst = dst[near]
+        order = np.lexsort((src, dst))
+        return src[order], dst[order]
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from checkpoint import save_checkpoint
+from interventions import get_scenario_parameters
+from population import Population
+from simulation import Simulator
+
+
+def make_simulator(engine, scenario='lockdown', **kwargs):
+    parameters = get_scenario_parameters(scenario)
+    parameters.update(population_size=150, **kwargs)
+    sim = Simulator(seed=5, engine=engine, **parameters)
+    sim.initialize()
+    return sim
+
+
+def population_columns(sim):
+    if sim.engine is not None:
+        return sim.engine.population.columns()
+    return Population.from_agents(sim.population).columns()
+
+
+@pytest.mark.parametrize('engine', ['object', 'array'])
+def test_statistics_after_resume(engine, tmp_path):
+    sim = make_simulator(engine)
+    for _ in range(24):
+        sim.run()
+    expected = sim.get_statistics('all')
+    save_checkpoint(sim, str(tmp_path / 'checkpoint.npz'))
+    resumed = Simulator.resume(str(tmp_path / 'checkpoint.npz'))
+    statistics = resumed.get_statistics('all')
+    for name in ('Q1', 'Q5', 'W_Business', 'W_Person', 'W_Government'):
+        assert name in statistics
+    assert statistics == expected
+
+
+@pytest.mark.parametrize('engine', ['object', 'array'])
+@pytest.mark.parametrize('scenario', ['do_nothing', 'partial_isolation', 'quarantine_zone'])
+def test_resume_is_exact(engine, scenario, tmp_path):
+    path = str(tmp_path / 'checkpoint.npz')
+    sim = make_simulator(engine, scenario, checkpoint_every=710, checkpoint_path=path)
+    for _ in range(710):
+        sim.run()
+    resumed = Simulator.resume(path)
+    assert resumed.iteration == sim.iteration
+    # 跨过天和月的边界
+    for _ in range(48):
+        sim.run()
+        resumed.run()
+    assert resumed.get_statistics('all') == sim.get_statistics('all')
+    expected = population_columns(sim)
+    for name, values in population_columns(resumed).items():
+        np.testing.assert_array_equal(values, expected[name], err_msg=name)
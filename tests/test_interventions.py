@@ -0,0 +1,12 @@
+import pytest
+
+from interventions import Scenario
+from simulation import Simulator
+
+
+@pytest.mark.parametrize('engine', ['object', 'array'])
+def test_misspelled_policy_params(engine):
+    scenario = Scenario.from_json('{"name": "rate", "policy": "quarantine_zone_rate", '
+                                  '"policy_params": {"rat": 0.5}}')
+    with pytest.raises(TypeError, match='rat'):
+        Simulator(engine=engine, **scenario.simulation_parameters())
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from population import ration
+
+
+def sequential_market(seller, qty, stocks):
+    """Orders served one by one, as in Business.supply"""
+    stocks = stocks.copy()
+    granted = np.zeros_like(qty)
+    for k, (s, q) in enumerate(zip(seller, qty)):
+        granted[k] = min(q, stocks[s])
+        stocks[s] -= granted[k]
+    return granted
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_ration(seed):
+    rng = np.random.default_rng(seed)
+    sellers = 20
+    seller = np.sort(rng.integers(0, sellers, 500))
+    qty = rng.integers(0, 10, 500)
+    # 部分公司无库存或库存不足
+    stocks = rng.integers(0, 60, sellers)
+    stocks[:3] = 0
+    np.testing.assert_array_equal(ration(seller, qty, stocks),
+                                  sequential_market(seller, qty, stocks))
+
+
+def test_ration_empty():
+    empty = np.zeros(0, dtype=np.int64)
+    assert len(ration(empty, empty, np.array([5]))) == 0
@@ -0,0 +1,49 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+from scipy.io import loadmat, savemat
+
+from matfile import MatFile, convert_to_npy, open_run
+
+RESULTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       'results', 'sim1')
+MAT_FILES = sorted(glob.glob(os.path.join(RESULTS, '*.mat')))
+
+
+def variables(path):
+    return {k: v for k, v in loadmat(path).items() if not k.startswith('__')}
+
+
+@pytest.mark.parametrize('path', MAT_FILES, ids=os.path.basename)
+def test_shipped_runs(path):
+    expected = variables(path)
+    mat = MatFile(path)
+    assert sorted(mat) == sorted(expected)
+    for name, values in expected.items():
+        np.testing.assert_array_equal(mat[name], values, err_msg=name)
+
+
+def test_series():
+    path = os.path.join(RESULTS, 'lockdown.mat')
+    expected = variables(path)
+    run = open_run(path)
+    np.testing.assert_array_equal(run.series('Death'), expected['Death'][0])
+    np.testing.assert_array_equal(run.series('person_status', 720, 744),
+                                  expected['person_status'][720:744])
+    assert run.final(['Death'])['Death'] == expected['Death'][0, -1]
+
+
+def test_compressed(tmp_path):
+    path = str(tmp_path / 'compressed.mat')
+    expected = {'a': np.arange(12.0).reshape(3, 4), 'b': np.arange(5, dtype=np.int32)[None, :],
+                'name': 'not numeric'}
+    savemat(path, expected, do_compression=True)
+    mat = MatFile(path)
+    assert sorted(mat) == ['a', 'b']
+    for name in mat:
+        np.testing.assert_array_equal(mat[name], expected[name])
+    npy = open_run(convert_to_npy(path, str(tmp_path / 'npy')))
+    for name in mat:
+        np.testing.assert_array_equal(npy[name], expected[name])
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from interventions import get_scenario_parameters
+from simulation import Simulator
+from spatial import PointIndex, neighbour_pairs
+
+
+def brute_force_pairs(x, y, radius):
+    i, j = np.triu_indices(len(x), k=1)
+    near = np.sqrt((x[i] - x[j]) ** 2 + (y[i] - y[j]) ** 2) <= radius
+    return i[near], j[near]
+
+
+def points(seed, n, integer=False):
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(-20, 40, (2, n))
+    # 网格上的点，许多距离恰好等于半径
+    return np.floor(xy) if integer else xy
+
+
+@pytest.mark.parametrize('integer', [False, True])
+@pytest.mark.parametrize('radius', [0.0, 1.0, 2.5, 7.0])
+def test_neighbour_pairs(integer, radius):
+    x, y = points(1, 400, integer)
+    i, j = neighbour_pairs(x, y, radius)
+    expected = brute_force_pairs(x, y, radius)
+    np.testing.assert_array_equal(i, expected[0])
+    np.testing.assert_array_equal(j, expected[1])
+
+
+def test_neighbour_pairs_small():
+    for n in (0, 1):
+        i, j = neighbour_pairs(np.zeros(n), np.zeros(n), 1.0)
+        assert len(i) == len(j) == 0
+
+
+@pytest.mark.parametrize('integer', [False, True])
+@pytest.mark.parametrize('radius', [0.0, 1.0, 5.0])
+def test_query_many(integer, radius):
+    px, py = points(2, 60, integer)
+    qx, qy = points(3, 300, integer)
+    src, dst = PointIndex(px, py, radius).query_many(qx, qy)
+    near = np.sqrt((qx[:, None] - px[None, :]) ** 2 + (qy[:, None] - py[None, :]) ** 2) <= radius
+    # 按point再按query排序
+    expected_dst, expected_src = np.nonzero(near.T)
+    np.testing.assert_array_equal(src, expected_src)
+    np.testing.assert_array_equal(dst, expected_dst)
+
+
+def test_contagion_grid_matches_brute_force():
+    statistics = []
+    for contagion_index in ('grid', 'brute_force'):
+        parameters = get_scenario_parameters('do_nothing')
+        parameters.update(population_size=80, contagion_index=contagion_index)
+        sim = Simulator(seed=3, **parameters)
+        sim.initialize()
+        for _ in range(72):
+            sim.run()
+        statistics.append(sim.get_statistics('all'))
+    assert statistics[0] == statistics[1]
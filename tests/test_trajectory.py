@@ -0,0 +1,83 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+from scipy.io import loadmat
+
+from trajectory import TrajectoryReader, convert_mat, save_trajectory
+
+RESULTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       'results', 'sim1')
+
+
+def random_walk(seed, ticks=500, agents=30):
+    rng = np.random.default_rng(seed)
+    positions = np.cumsum(rng.integers(-3, 4, (ticks, agents, 2)), axis=0) + 100
+    status = np.cumsum(rng.random((ticks, agents)) < 0.01, axis=0) % 4
+    return positions.astype(np.float64), status.astype(np.uint8)
+
+
+@pytest.mark.parametrize('keyframe_interval', [1, 7, 240, 1000])
+def test_round_trip(keyframe_interval, tmp_path):
+    positions, status = random_walk(keyframe_interval)
+    path = str(tmp_path / 'walk.traj.npz')
+    save_trajectory(path, positions, status, keyframe_interval=keyframe_interval,
+                    statistics={'Infected': status.mean(axis=1)})
+    with TrajectoryReader(path) as t:
+        p, s = t.read()
+        np.testing.assert_array_equal(p, positions)
+        np.testing.assert_array_equal(s, status)
+        p, s = t.read(123, 345)
+        np.testing.assert_array_equal(p, positions[123:345])
+        np.testing.assert_array_equal(s, status[123:345])
+        for tick in (0, 239, 240, 499):
+            p, s = t.frame(tick)
+            np.testing.assert_array_equal(p, positions[tick])
+            np.testing.assert_array_equal(s, status[tick])
+        np.testing.assert_array_equal(t.statistics['Infected'], status.mean(axis=1))
+        assert t.max_error == 0
+
+
+def test_off_grid(tmp_path):
+    positions, status = random_walk(0)
+    positions[10, 3, 0] += 0.25
+    path = str(tmp_path / 'walk.traj.npz')
+    with pytest.raises(ValueError, match='off the grid'):
+        save_trajectory(path, positions, status)
+    save_trajectory(path, positions, status, exact=False)
+    with TrajectoryReader(path) as t:
+        assert t.max_error == 0.25
+    save_trajectory(path, positions, status, resolution=0.25)
+    with TrajectoryReader(path) as t:
+        np.testing.assert_array_equal(t.read()[0], positions)
+
+
+def test_keyframe_interval(tmp_path):
+    positions, status = random_walk(0)
+    for keyframe_interval in (0, 65537):
+        with pytest.raises(ValueError, match='keyframe_interval'):
+            save_trajectory(str(tmp_path / 'walk.traj.npz'), positions, status,
+                            keyframe_interval=keyframe_interval)
+
+
+@pytest.mark.parametrize('name', ['do_nothing', 'lockdown'])
+def test_convert_shipped_run(name, tmp_path):
+    mat_path = str(tmp_path / (name + '.mat'))
+    shutil.copy(os.path.join(RESULTS, name + '.mat'), mat_path)
+    expected = loadmat(mat_path)
+    with TrajectoryReader(convert_mat(mat_path)) as t:
+        positions, status = t.read()
+        np.testing.assert_array_equal(positions, expected['person_position'])
+        np.testing.assert_array_equal(status, expected['person_status'])
+        np.testing.assert_array_equal(t.statistics['Death'], expected['Death'])
+
+
+def test_convert_off_grid_run(tmp_path):
+    mat_path = str(tmp_path / 'quarantine_zone.mat')
+    shutil.copy(os.path.join(RESULTS, 'quarantine_zone.mat'), mat_path)
+    with pytest.raises(ValueError, match='off the grid'):
+        convert_mat(mat_path)
+    with TrajectoryReader(convert_mat(mat_path, exact=False)) as t:
+        positions = loadmat(mat_path)['person_position']
+        assert np.abs(t.read()[0] - positions).max() == t.max_error <= 0.5
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from population import ASYMPTOMATIC, HOSPITALIZATION, SEVERE, daily_transitions
+
+
+def per_person_transitions(severity, recovering, probs, uniforms, occupied,
+                           population_size, critical_limit):
+    """The daily update of the infected persons, one at a time"""
+    p_hosp, p_severe, p_death = probs
+    n = len(severity)
+    to_hospital, to_severe, dies, recovers = (np.zeros(n, dtype=bool) for _ in range(4))
+    for k in range(n):
+        s = severity[k]
+        if s == ASYMPTOMATIC and p_hosp[k] > uniforms[k, 0]:
+            s = HOSPITALIZATION
+            to_hospital[k] = True
+            occupied += 1
+        elif s == HOSPITALIZATION and p_severe[k] > uniforms[k, 0]:
+            s = SEVERE
+            to_severe[k] = True
+            # 医院超出承载能力
+            if occupied / population_size >= critical_limit:
+                dies[k] = True
+                occupied -= 1
+                continue
+        if p_death[k] > uniforms[k, 1]:
+            dies[k] = True
+        elif recovering[k]:
+            recovers[k] = True
+        else:
+            continue
+        occupied -= s in (HOSPITALIZATION, SEVERE)
+    return to_hospital, to_severe, dies, recovers
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_daily_transitions(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(200):
+        n = rng.integers(1, 40)
+        severity = rng.choice([ASYMPTOMATIC, HOSPITALIZATION, SEVERE], n).astype(np.uint8)
+        recovering = rng.random(n) < 0.3
+        probs = tuple(rng.uniform(0, 0.6, (3, n)))
+        uniforms = rng.random((n, 2))
+        occupied = int(np.count_nonzero(severity != ASYMPTOMATIC)) + int(rng.integers(0, 10))
+        critical_limit = rng.uniform(0.01, 0.3)
+        args = (severity, recovering, probs, uniforms, occupied, 100, critical_limit)
+        transitions = daily_transitions(*args)
+        for actual, expected in zip(transitions, per_person_transitions(*args)):
+            np.testing.assert_array_equal(actual, expected)
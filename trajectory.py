@@ -0,0 +1,233 @@
+"""
+Compact storage of agent trajectories
+
+Positions are integers on the grid of the world (the move_to_* methods
+truncate them, except in the quarantine zone) and statuses rarely change,
+so a trajectory is stored in chunks of keyframe_interval ticks, each one
+holding
+
+    keyframe_<k>  int16 (agents, 2)     positions at the first tick of the chunk
+    deltas_<k>    int16 (n-1, agents, 2) position changes of the next ticks
+    status_<k>    uint8 (agents,)       statuses at the first tick of the chunk
+    changes_<k>   CHANGE_DTYPE          (tick in the chunk, agent, new status)
+
+in a compressed .npz archive, whose entries are compressed and read one
+by one: reading a tick only decodes its chunk.
+
+    save_trajectory('lockdown.traj.npz', positions, status)
+    with TrajectoryReader('lockdown.traj.npz') as t:
+        positions, status = t.frame(720)
+
+Positions off the grid of `resolution` are an error, unless exact=False:
+they are then rounded and the largest error is kept in the file.
+Running this module converts the .mat files of Simulator runs:
+
+    python trajectory.py results/sim1/*.mat
+    python trajectory.py --inexact results/sim1/quarantine_zone.mat
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+CHANGE_DTYPE = np.dtype([('tick', np.uint16),
+                         ('agent', np.uint32),
+                         ('status', np.uint8)])
+
+INT16_MAX = np.iinfo(np.int16).max
+# changes的tick为块内偏移 (uint16)
+MAX_KEYFRAME_INTERVAL = np.iinfo(np.uint16).max + 1
+
+
+def encode_chunk(positions, status):
+    """
+    :param positions: integer positions (n, agents, 2)
+    :param status: status codes (n, agents)
+    :return: {name: array} of one chunk, names without the chunk number
+    """
+    deltas = np.diff(positions, axis=0)
+    ticks, agents = np.nonzero(status[1:] != status[:-1])
+    changes = np.zeros(len(ticks), dtype=CHANGE_DTYPE)
+    changes['tick'] = ticks + 1
+    changes['agent'] = agents
+    changes['status'] = status[ticks + 1, agents]
+    return {'keyframe': positions[0].astype(np.int16),
+            'deltas': deltas.astype(np.int16),
+            'status': status[0].astype(np.uint8),
+            'changes': changes}
+
+
+def decode_chunk(keyframe, deltas, status, changes):
+    """Inverse of encode_chunk, (positions (n, agents, 2) int, status (n, agents) uint8)"""
+    positions = np.empty((len(deltas) + 1,) + keyframe.shape, dtype=np.int32)
+    positions[0] = keyframe
+    np.cumsum(deltas, axis=0, dtype=np.int32, out=positions[1:])
+    positions[1:] += keyframe
+    states = np.repeat(status[None, :], len(positions), axis=0)
+    for tick, agent, s in changes:
+        states[tick:, agent] = s
+    return positions, states
+
+
+def save_trajectory(path, positions, status, keyframe_interval=240, resolution=1.0,
+                    statistics=None, exact=True):
+    """
+    :param positions: positions of every agent at every tick (ticks, agents, 2)
+    :param status: status code of every agent at every tick (ticks, agents)
+    :param keyframe_interval: ticks per chunk, at most MAX_KEYFRAME_INTERVAL
+    :param resolution: positions are stored as multiples of resolution
+    :param statistics: {name: array} saved along, e.g. the statistics of the run
+    :param exact: raise ValueError if some positions are not multiples of
+        resolution, otherwise round them
+    """
+    if not 1 <= keyframe_interval <= MAX_KEYFRAME_INTERVAL:
+        raise ValueError('keyframe_interval must be in [1, {}]: {}'.format(
+            MAX_KEYFRAME_INTERVAL, keyframe_interval))
+    positions = np.asarray(positions, dtype=np.float64)
+    grid = np.rint(positions / resolution)
+    errors = np.abs(grid * resolution - positions)
+    error = errors.max() if errors.size else 0.0
+    # 容许浮点误差
+    off_grid = np.count_nonzero(errors > resolution * 1e-6)
+    if exact and off_grid:
+        raise ValueError('{} positions off the grid of resolution {} (up to {:.3g}), '
+                         'use a finer resolution or exact=False'.format(off_grid, resolution, error))
+    # 差分需在int16范围内
+    if grid.size and np.abs(grid).max() > INT16_MAX // 2:
+        raise ValueError('positions out of range for int16 deltas, increase resolution')
+    grid = grid.astype(np.int32)
+    status = np.asarray(status)
+    if status.shape != grid.shape[:2]:
+        raise ValueError('positions and status shapes differ: {} {}'.format(grid.shape, status.shape))
+    ticks, agents = status.shape
+    arrays = {}
+    for chunk, start in enumerate(range(0, ticks, keyframe_interval)):
+        stop = start + keyframe_interval
+        for name, values in encode_chunk(grid[start:stop], status[start:stop]).items():
+            arrays['{}_{}'.format(name, chunk)] = values
+    for name, values in (statistics or {}).items():
+        arrays['statistics.' + name] = np.asarray(values)
+    meta = {
+        'version': FORMAT_VERSION,
+        'ticks': ticks,
+        'agents': agents,
+        'keyframe_interval': keyframe_interval,
+        'resolution': resolution,
+        'max_error': float(error),
+    }
+    arrays['meta'] = np.array(json.dumps(meta))
+    np.savez_compressed(path, **arrays)
+
+
+class TrajectoryReader:
+    """Random access by tick to a file of save_trajectory, one chunk at a time"""
+    def __init__(self, path):
+        self.data = np.load(path)
+        meta = json.loads(str(self.data['meta']))
+        if meta['version'] != FORMAT_VERSION:
+            raise ValueError('unsupported trajectory version: {}'.format(meta['version']))
+        self.ticks = meta['ticks']
+        self.agents = meta['agents']
+        self.keyframe_interval = meta['keyframe_interval']
+        self.resolution = meta['resolution']
+        # 四舍五入造成的最大位置误差，无损时为0
+        self.max_error = meta.get('max_error', 0.0)
+        self._cached = (None, None)
+
+    def __len__(self):
+        return self.ticks
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.data.close()
+
+    @property
+    def statistics(self):
+        """{name: array} saved with the trajectory"""
+        prefix = 'statistics.'
+        return {k[len(prefix):]: self.data[k] for k in self.data.files if k.startswith(prefix)}
+
+    def chunk(self, k):
+        """Decoded chunk k, (positions, status), the last one is kept"""
+        if self._cached[0] != k:
+            decoded = decode_chunk(*(self.data['{}_{}'.format(name, k)]
+                                     for name in ('keyframe', 'deltas', 'status', 'changes')))
+            self._cached = (k, decoded)
+        return self._cached[1]
+
+    def _positions(self, grid):
+        return grid * self.resolution if self.resolution != 1 else grid.astype(np.float64)
+
+    def frame(self, tick):
+        """(positions (agents, 2), status (agents,)) at tick"""
+        if not 0 <= tick < self.ticks:
+            raise IndexError(tick)
+        positions, status = self.chunk(tick // self.keyframe_interval)
+        offset = tick % self.keyframe_interval
+        return self._positions(positions[offset]), status[offset].copy()
+
+    def read(self, start=0, stop=None):
+        """(positions (n, agents, 2), status (n, agents)) of the ticks [start, stop)"""
+        stop = self.ticks if stop is None else min(stop, self.ticks)
+        positions, states = [], []
+        for k in range(start // self.keyframe_interval, -(-stop // self.keyframe_interval)):
+            lo = k * self.keyframe_interval
+            p, s = self.chunk(k)
+            sel = slice(max(start, lo) - lo, stop - lo)
+            positions.append(p[sel])
+            states.append(s[sel])
+        if not positions:
+            return np.zeros((0, self.agents, 2)), np.zeros((0, self.agents), dtype=np.uint8)
+        return self._positions(np.concatenate(positions)), np.concatenate(states)
+
+
+def convert_mat(mat_path, path=None, keyframe_interval=240, resolution=1.0, exact=True):
+    """
+    Convert a .mat file of a Simulator run (statistics, person_position,
+    person_status) with save_trajectory
+    :return: path of the new file, mat_path with the extension .traj.npz by default
+    """
+    from scipy.io import loadmat
+    data = loadmat(mat_path)
+    if 'person_position' not in data or 'person_status' not in data:
+        raise ValueError('{} has no trajectory'.format(mat_path))
+    if path is None:
+        path = os.path.splitext(mat_path)[0] + '.traj.npz'
+    statistics = {k: v for k, v in data.items()
+                  if not k.startswith('__') and k not in ('person_position', 'person_status')}
+    save_trajectory(path, data['person_position'], data['person_status'].astype(np.uint8),
+                    keyframe_interval=keyframe_interval, resolution=resolution,
+                    statistics=statistics, exact=exact)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Convert Simulator runs to trajectory files')
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--keyframe-interval', type=int, default=240)
+    parser.add_argument('--resolution', type=float, default=1.0)
+    parser.add_argument('--inexact', action='store_true',
+                        help='round the positions off the grid instead of failing')
+    args = parser.parse_args()
+
+    for mat_path in args.paths:
+        try:
+            path = convert_mat(mat_path, keyframe_interval=args.keyframe_interval,
+                               resolution=args.resolution, exact=not args.inexact)
+        except ValueError as e:
+            print('{}: {}'.format(mat_path, e))
+            continue
+        before, after = os.path.getsize(mat_path), os.path.getsize(path)
+        with TrajectoryReader(path) as t:
+            error = t.max_error
+        print('{} -> {}: {} -> {} bytes ({:.1f}x), max error {:.3g}'.format(
+            mat_path, path, before, after, before / after, error))